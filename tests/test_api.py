@@ -1,13 +1,15 @@
 import os
 import datetime
+from unittest.mock import patch
 
 from flask_testing import TestCase
 from freezegun.api import freeze_time
 
+from tips.api import tip_generator
 from tips.api.tip_generator import tips_pool
 from tips.config import PROJECT_PATH
 from tips.server import application
-from tests.fixtures.fixture import get_fixture_without_source_tips
+from tests.fixtures.fixture import get_fixture, get_fixture_without_source_tips
 
 
 class ApiTests(TestCase):
@@ -98,6 +100,72 @@ class ApiTests(TestCase):
         tips = response.get_json()
         self.assertEqual(len(tips), 12)
 
+    @freeze_time("2022-03-03")
+    def test_tips_limit_offset(self):
+        client_data = get_fixture_without_source_tips(optin=False)
+
+        response = self.client.post("/tips/gettips", json=client_data)
+        tips = response.get_json()
+        self.assertEqual(len(tips), 12)
+
+        response = self.client.post("/tips/gettips?limit=5", json=client_data)
+        self.assertEqual(response.get_json(), tips[:5])
+
+        response = self.client.post("/tips/gettips?limit=5&offset=3", json=client_data)
+        self.assertEqual(response.get_json(), tips[3:8])
+
+        response = self.client.post("/tips/gettips?offset=10", json=client_data)
+        self.assertEqual(response.get_json(), tips[10:])
+
+        response = self.client.post("/tips/gettips?limit=-1", json=client_data)
+        self.assert400(response)
+
+    def test_tips_version_header(self):
+        version = tip_generator.rule_set.version
+
+        response = self.client.post(
+            "/tips/gettips", json=get_fixture_without_source_tips(optin=False)
+        )
+        self.assertEqual(response.headers["X-Tips-Version"], version)
+
+        response = self.client.post("/tips/gettips/batch", json=[{}])
+        self.assertEqual(response.headers["X-Tips-Version"], version)
+
+    @freeze_time("2021-05-09")
+    def test_tips_batch(self):
+        bodies = [
+            get_fixture(optin=True),
+            get_fixture(optin=False),
+            get_fixture_without_source_tips(optin=True),
+            {},
+        ]
+
+        response = self.client.post("/tips/gettips/batch", json=bodies)
+        self.assert200(response)
+        results = response.get_json()
+
+        self.assertEqual(len(results), 4)
+        for body, result in zip(bodies, results):
+            response = self.client.post("/tips/gettips", json=body)
+            self.assertEqual(result, response.get_json())
+
+        response = self.client.post(
+            "/tips/gettips/batch?audience=zakelijk", json=bodies[:2]
+        )
+        results = response.get_json()
+        for body, result in zip(bodies, results):
+            response = self.client.post("/tips/gettips?audience=zakelijk", json=body)
+            self.assertEqual(result, response.get_json())
+
+        response = self.client.post("/tips/gettips/batch", json={})
+        self.assert400(response)
+
+        response = self.client.post("/tips/gettips/batch", json=[{}] * 100)
+        self.assert200(response)
+
+        response = self.client.post("/tips/gettips/batch", json=[{}] * 101)
+        self.assert400(response)
+
 
 class ApiStaticFiles(TestCase):
     def create_app(self):
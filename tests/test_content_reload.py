@@ -0,0 +1,209 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from tips.generator import rule_engine
+from tips.generator.rule_engine import RuleStats
+
+from tips.api import tip_generator
+from tips.api.tip_generator import (
+    COMPOUND_RULES_FILE,
+    TIP_ENRICHMENT_FILE,
+    TIPS_POOL_FILE,
+    ContentWatcher,
+    RuleReorderer,
+    RuleSet,
+    get_evaluation_context,
+    install_rule_set,
+    refresh_tips_pool,
+    reload_content,
+    tips_generator,
+)
+from tests.fixtures.fixture import get_fixture_without_source_tips
+from tips.server import get_tips_request_data
+
+
+class ContentReloadTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = []
+        for path in (TIPS_POOL_FILE, TIP_ENRICHMENT_FILE, COMPOUND_RULES_FILE):
+            copy = os.path.join(self.directory, os.path.basename(path))
+            shutil.copy(path, copy)
+            self.files.append(copy)
+
+        patcher = patch.multiple(
+            tip_generator,
+            TIPS_POOL_FILE=self.files[0],
+            TIP_ENRICHMENT_FILE=self.files[1],
+            COMPOUND_RULES_FILE=self.files[2],
+        )
+        patcher.start()
+        # cleanups run last first, the original files are reloaded after the patch is undone
+        self.addCleanup(reload_content)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_pool(self, content):
+        with open(self.files[0], "w") as fp:
+            fp.write(content)
+        # make sure the modification time changes on file systems with a coarse clock
+        stat = os.stat(self.files[0])
+        os.utime(self.files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def get_watcher(self):
+        watcher = ContentWatcher(1)
+        watcher.files = tuple(self.files)
+        watcher.mtimes = watcher.get_mtimes()
+        return watcher
+
+    def test_reasons_after_refresh(self):
+        """The reasons of the tips are lists, also when the pool is refreshed at runtime."""
+        refresh_tips_pool()
+
+        for tip in tip_generator.tips_index.tips:
+            self.assertIsInstance(tip["reason"], tuple, tip["id"])
+        for record in tip_generator.tips_index.records:
+            self.assertIsInstance(json.loads(record.encoded)["reason"], list)
+
+        # the source is not modified, refreshing again gives the same reasons
+        reasons = [tip["reason"] for tip in tip_generator.tips_index.tips]
+        refresh_tips_pool()
+        self.assertEqual(
+            [tip["reason"] for tip in tip_generator.tips_index.tips], reasons
+        )
+
+    def test_watcher_reloads(self):
+        watcher = self.get_watcher()
+        self.assertFalse(watcher.check())
+
+        old_index = tip_generator.tips_index
+        with open(self.files[0]) as fp:
+            pool = json.load(fp)
+        self.write_pool(json.dumps(pool[:3]))
+
+        self.assertTrue(watcher.check())
+        self.assertIsNot(tip_generator.tips_index, old_index)
+        self.assertNotEqual(tip_generator.tips_index.version, old_index.version)
+        self.assertEqual(len(tip_generator.tips_index.tips), 3)
+        self.assertIs(tip_generator.tips_pool, tip_generator.tips_index.source)
+        # the previous index is not changed, requests which use it can finish
+        self.assertEqual(len(old_index.tips), len(pool))
+
+    def test_watcher_keeps_content_on_error(self):
+        watcher = self.get_watcher()
+        old_index = tip_generator.tips_index
+
+        self.write_pool("[{")
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(watcher.check())
+        self.assertIs(tip_generator.tips_index, old_index)
+
+        with open(TIPS_POOL_FILE) as fp:
+            pool = json.load(fp)
+        pool[0]["rules"] = [{"type": "rule", "rule": "$.a[", "reason": ""}]
+        self.write_pool(json.dumps(pool))
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(watcher.check())
+        self.assertIs(tip_generator.tips_index, old_index)
+
+
+class RuleSetTest(TestCase):
+    def tearDown(self):
+        reload_content()
+
+    def test_read_only(self):
+        rule_set = tip_generator.rule_set
+
+        with self.assertRaises(AttributeError):
+            rule_set.version = ""
+        with self.assertRaises(TypeError):
+            rule_set.compound_rules["new"] = {}
+        with self.assertRaises(TypeError):
+            rule_set.pool[0]["active"] = False
+        self.assertIs(tip_generator.tips_index, rule_set.index)
+        self.assertIs(tip_generator.compound_rules, rule_set.compound_rules)
+
+    def test_compact(self):
+        """Equal values in the content share one copy."""
+        rule_set = tip_generator.rule_set
+        pool = {tip["id"]: tip for tip in rule_set.pool}
+
+        for tip, record in zip(rule_set.index.tips, rule_set.index.records):
+            self.assertIs(record["title"], tip["title"])
+            self.assertIs(tip["title"], pool[tip["id"]]["title"])
+
+        rules = [rule for tip in rule_set.pool for rule in tip.get("rules", [])]
+        self.assertLess(len(set(map(id, rules))), len(rules))
+
+    def test_version(self):
+        rule_set = tip_generator.rule_set
+        pool = json.loads(json.dumps(rule_set.pool))
+
+        self.assertEqual(
+            RuleSet(pool, rule_set.enrichments, rule_set.compound_rules).version,
+            rule_set.version,
+        )
+        self.assertEqual(rule_set.reindex().version, rule_set.version)
+        self.assertNotEqual(
+            RuleSet(pool[1:], rule_set.enrichments, rule_set.compound_rules).version,
+            rule_set.version,
+        )
+
+    def test_request_pinned(self):
+        """A request only uses the rule set it was given, also when another is installed."""
+        request_data = get_fixture_without_source_tips(optin=False)
+        request_data = get_tips_request_data(request_data)
+        old_rule_set = tip_generator.rule_set
+        expected = tips_generator(request_data)
+
+        install_rule_set(RuleSet([], [], {}))
+        self.assertEqual(tips_generator(request_data), [])
+        self.assertEqual(tips_generator(request_data, snapshot=old_rule_set), expected)
+
+        # installing the old rule set again is enough to roll back
+        install_rule_set(old_rule_set)
+        self.assertEqual(tips_generator(request_data), expected)
+
+
+class RuleReordererTest(TestCase):
+    def tearDown(self):
+        reload_content()
+
+    def test_reorder(self):
+        rule_set = tip_generator.rule_set
+        position, tip = next(
+            (position, tip)
+            for position, tip in enumerate(rule_set.index.tips)
+            if len([r for r in tip.get("rules", ()) if r["type"] == "rule"]) > 1
+        )
+        rules = [rule for rule in tip["rules"] if rule["type"] == "rule"]
+
+        stats = RuleStats()
+        with patch.object(rule_engine, "rule_stats", stats):
+            reorderer = RuleReorderer(1)
+            self.assertFalse(reorderer.check())
+
+            # the rule which is ordered last now always fails and is cheap
+            for key in {rule_engine.rule_key(rule) for rule in tip["rules"]}:
+                for _ in range(rule_engine.MIN_SAMPLES):
+                    if key == ("rule", rules[-1]["rule"]):
+                        stats.record(key, 0.001, False)
+                    else:
+                        stats.record(key, 0.01, True)
+            self.assertTrue(reorderer.check())
+
+        reordered = tip_generator.rule_set
+        self.assertIsNot(reordered, rule_set)
+        self.assertEqual(reordered.version, rule_set.version)
+        self.assertIs(reordered.compiled_rules, rule_set.compiled_rules)
+        self.assertEqual(reordered.index.tips[position]["rules"][0], rules[-1])
+
+    def test_sample_rate(self):
+        self.assertIsNone(get_evaluation_context().stats)
+
+        with patch.object(tip_generator, "rule_stats_sample_rate", 1.0):
+            self.assertIs(get_evaluation_context().stats, rule_engine.rule_stats)
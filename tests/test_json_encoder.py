@@ -0,0 +1,35 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+from tips.api import json_encoder
+from tips.api.json_encoder import encode, encode_tips, encode_tips_batch
+from tips.api.tip_generator import tips_index, TipRecord
+
+
+class JsonEncoderTest(TestCase):
+    def test_encode(self):
+        value = {"b": [1, {"x": "é"}], "a": None, "c": (True, 1.5)}
+        expected = b'{"a":null,"b":[1,{"x":"\xc3\xa9"}],"c":[true,1.5]}'
+
+        self.assertEqual(encode(value), expected)
+        with patch.object(json_encoder, "orjson", None):
+            self.assertEqual(encode(value), expected)
+
+    def test_encode_tips(self):
+        record = TipRecord({"id": "pool", "reason": ("a",)})
+        source_tip = {"id": "source", "reason": []}
+
+        # the encoding of the record is used as it is
+        record.encoded = b'{"id":"encoded"}'
+        result = json.loads(encode_tips([record, source_tip]))
+        self.assertEqual(result, [{"id": "encoded"}, source_tip])
+
+        self.assertEqual(encode_tips([]), b"[]")
+        self.assertEqual(
+            json.loads(encode_tips_batch([[source_tip], []])), [[source_tip], []]
+        )
+
+    def test_pool_records(self):
+        for record in tips_index.records:
+            self.assertEqual(json.loads(record.encoded), json.loads(json.dumps(record)))
@@ -0,0 +1,61 @@
+import gc
+import sys
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from tips.preload import finish_preload, preloading, start_preload
+
+
+class PreloadTest(TestCase):
+    def setUp(self):
+        self.postfork = []
+        self.opt = {}
+        self.modules = {
+            "uwsgi": SimpleNamespace(opt=self.opt, worker_id=lambda: 0),
+            "uwsgidecorators": SimpleNamespace(postfork=self.postfork.append),
+        }
+        self.addCleanup(gc.enable)
+        self.addCleanup(gc.unfreeze)
+
+    def uwsgi(self, freeze="1"):
+        return patch.dict(sys.modules, self.modules), patch.dict(
+            "os.environ", {"TIPS_GC_FREEZE": freeze}
+        )
+
+    def test_not_uwsgi(self):
+        # the tests, or a server without uWSGI
+        with patch.dict("os.environ", {"TIPS_GC_FREEZE": "1"}):
+            self.assertFalse(preloading())
+            start_preload()
+            finish_preload()
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+    def test_preload(self):
+        modules, environ = self.uwsgi()
+        with modules, environ:
+            start_preload()
+            self.assertFalse(gc.isenabled())
+            finish_preload()
+
+        self.assertGreater(gc.get_freeze_count(), 0)
+        self.assertFalse(gc.isenabled())
+
+        # every forked worker enables the collector
+        self.assertEqual(self.postfork, [gc.enable])
+        self.postfork[0]()
+        self.assertTrue(gc.isenabled())
+
+    def test_not_preloading(self):
+        for freeze, opt in [("0", {}), ("1", {"lazy-apps": True}), ("1", {"lazy": 1})]:
+            self.opt.clear()
+            self.opt.update(opt)
+            modules, environ = self.uwsgi(freeze)
+            with modules, environ:
+                self.assertFalse(preloading())
+                start_preload()
+                finish_preload()
+            self.assertTrue(gc.isenabled())
+            self.assertEqual(gc.get_freeze_count(), 0)
+            self.assertEqual(self.postfork, [])
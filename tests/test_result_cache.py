@@ -0,0 +1,212 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+
+from freezegun import freeze_time
+
+from tips.api import tip_generator
+from tips.api.result_cache import (
+    create_result_cache,
+    MemoryCache,
+    result_cache_key,
+    SQLiteCache,
+)
+from tips.api.tip_generator import refresh_tips_index, tips_generator
+from tips.server import get_tips_request_data
+from tests.fixtures.fixture import get_fixture
+
+
+def set_in_child(cache):
+    cache.set("child", [1, 2, 3])
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_caches(self, maxsize, ttl):
+        # touch and evict on every call, so the sqlite cache is as exact as the memory cache
+        return [
+            MemoryCache(maxsize, ttl),
+            SQLiteCache(self.path, maxsize, ttl, touch_interval=0, evict_interval=1),
+        ]
+
+    def test_lru(self):
+        for cache in self.create_caches(maxsize=2, ttl=60):
+            with patch("tips.api.result_cache.time", side_effect=range(100, 200)):
+                cache.set("a", [1])
+                cache.set("b", [2])
+                self.assertEqual(cache.get("a"), [1])
+
+                # b is the least recently used
+                cache.set("c", [3])
+                self.assertEqual(len(cache), 2)
+                self.assertIsNone(cache.get("b"))
+                self.assertEqual(cache.get("a"), [1])
+                self.assertEqual(cache.get("c"), [3])
+
+            self.assertEqual(cache.hits, 3)
+            self.assertEqual(cache.misses, 1)
+            self.assertEqual(cache.hit_ratio(), 0.75)
+
+            cache.clear()
+            self.assertIsNone(cache.get("a"))
+
+    def test_ttl(self):
+        def clock(now):
+            return patch.multiple(
+                "tips.api.result_cache",
+                monotonic=lambda: now,
+                time=lambda: now,
+            )
+
+        for cache in self.create_caches(maxsize=2, ttl=60):
+            with clock(100):
+                cache.set("a", [1])
+            with clock(159):
+                self.assertEqual(cache.get("a"), [1])
+            with clock(160):
+                self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_shared(self):
+        cache = SQLiteCache(self.path, maxsize=10, ttl=60)
+        cache.set("parent", [0])
+
+        # a forked worker reconnects and shares the file with the other processes
+        process = multiprocessing.get_context("fork").Process(
+            target=set_in_child, args=(cache,)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+        self.assertEqual(cache.get("child"), [1, 2, 3])
+        other = SQLiteCache(self.path, maxsize=10, ttl=60)
+        self.assertEqual(other.get("parent"), [0])
+
+        # the results of an older version are not dropped, other workers may use them
+        other.invalidate()
+        self.assertEqual(len(other), 2)
+
+    def test_sqlite_sampled(self):
+        cache = SQLiteCache(self.path, maxsize=2, ttl=60, evict_interval=4)
+
+        def used():
+            query = "SELECT used FROM results WHERE key = 'a'"
+            return cache._connection().execute(query).fetchone()[0]
+
+        with patch("tips.api.result_cache.time", return_value=100):
+            cache.set("a", [1])
+        # used less than touch_interval ago, the lookup does not write
+        with patch("tips.api.result_cache.time", return_value=105):
+            self.assertEqual(cache.get("a"), [1])
+        self.assertEqual(used(), 100)
+        with patch("tips.api.result_cache.time", return_value=106):
+            self.assertEqual(cache.get("a"), [1])
+        self.assertEqual(used(), 106)
+
+        with patch("tips.api.result_cache.time", return_value=107):
+            for key in "bc":
+                cache.set(key, [2])
+            self.assertEqual(len(cache), 3)
+            # evicted on the fourth set
+            cache.set("d", [2])
+            self.assertEqual(len(cache), 2)
+
+    def test_sqlite_error(self):
+        cache = SQLiteCache(self.path, maxsize=10, ttl=60)
+        cache.set("a", [1])
+
+        with patch.object(cache, "_connection", side_effect=sqlite3.OperationalError):
+            with self.assertLogs(level="WARNING"):
+                self.assertIsNone(cache.get("a"))
+                cache.set("b", [2])
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.get("a"), [1])
+        self.assertIsNone(cache.get("b"))
+
+        # a database locked by another worker is skipped as well
+        locked = sqlite3.connect(self.path, isolation_level=None)
+        locked.execute("BEGIN EXCLUSIVE")
+        try:
+            with self.assertLogs(level="WARNING"):
+                cache.set("b", [2])
+        finally:
+            locked.close()
+        self.assertIsNone(cache.get("b"))
+
+    def test_sqlite_private_directory(self):
+        path = os.path.join(self.directory.name, "results", "cache.sqlite3")
+        cache = create_result_cache("sqlite", 10, 60, path)
+        self.assertIsInstance(cache, SQLiteCache)
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+
+        # a directory others can write to can not be trusted
+        os.chmod(self.directory.name, 0o777)
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(create_result_cache("sqlite", 10, 60, self.path))
+
+    def test_key(self):
+        paths = {"BRP": {"persoon": None}}
+        request_data = {
+            "optin": True,
+            "user_data": {"BRP": {"persoon": {"voornamen": "Jan"}, "adres": "x"}},
+        }
+        today = date(2021, 5, 9)
+        key = result_cache_key(request_data, ["a", "b"], today, paths)
+
+        # no user data in the key
+        self.assertNotIn("Jan", key)
+
+        # data the rules do not read and the order of the audience do not matter
+        request_data["user_data"]["BRP"]["adres"] = "y"
+        self.assertEqual(key, result_cache_key(request_data, ["b", "a"], today, paths))
+
+        self.assertNotEqual(key, result_cache_key(request_data, ["a"], today, paths))
+        self.assertNotEqual(
+            key, result_cache_key(request_data, ["a", "b"], date(2021, 5, 10), paths)
+        )
+        self.assertNotEqual(
+            key, result_cache_key(request_data, ["a", "b"], today, paths, version="1")
+        )
+        request_data["user_data"]["BRP"]["persoon"]["voornamen"] = "Piet"
+        self.assertNotEqual(
+            key, result_cache_key(request_data, ["a", "b"], today, paths)
+        )
+
+        # without optin the user data is not used
+        request_data["optin"] = False
+        self.assertEqual(
+            result_cache_key(request_data, None, today, paths),
+            result_cache_key({"optin": False, "user_data": {}}, None, today, paths),
+        )
+
+    @freeze_time("2021-05-09")
+    def test_tips_generator(self):
+        request_data = get_tips_request_data(get_fixture(optin=True))
+        expected = tips_generator(request_data)
+
+        for cache in self.create_caches(maxsize=10, ttl=60):
+            with patch.object(tip_generator, "result_cache", cache):
+                self.assertEqual(tips_generator(request_data), expected)
+                self.assertEqual(cache.misses, 1)
+
+                # the cached result is used for any limit
+                self.assertEqual(tips_generator(request_data, limit=2), expected[:2])
+                self.assertEqual(tips_generator(request_data), expected)
+                self.assertEqual(cache.hits, 2)
+                self.assertEqual(len(cache), 1)
+
+                # the same content gives the same version
+                version = tip_generator.tips_index.version
+                refresh_tips_index()
+                self.assertEqual(tip_generator.tips_index.version, version)
+                self.assertEqual(tips_generator(request_data), expected)
@@ -0,0 +1,134 @@
+import copy
+import json
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from freezegun import freeze_time
+from objectpath.core import generator, chain
+
+from tips.api.user_data_tree import UserDataTree
+from tips.config import PROJECT_PATH
+from tips.generator.rule_compiler import (
+    compile_native,
+    compile_native_rules,
+    UnsupportedRule,
+)
+from tips.generator.rule_engine import apply_rules, compile_rule
+from tests.fixtures.fixture import get_fixture
+
+TIPS_POOL_FILE = os.path.join(PROJECT_PATH, "api", "tips_pool.json")
+COMPOUND_RULES_FILE = os.path.join(PROJECT_PATH, "api", "compound_rules.json")
+
+EXTRA_RULES = [
+    "2 > 1",
+    "false",
+    "True",
+    "@",
+    "$.BRP.kinderen",
+    "len($.BRP.kinderen) is 0",
+    "$.BRP.adresHistorisch[1].woonplaatsNaam",
+    "$.WPI_AANVRAGEN[@.id is '810805911' and @.steps.*[@.id is 'aanvraag']]",
+    "$.WPI_AANVRAGEN.*[@.steps or @.about is 'nothing']",
+    "$.BRP.persoon.nationaliteiten[@.omschrijving is Nederlandse]",
+    "$.BRP.persoon.geboortedatum in ['1950-01-01T00:00:00Z', 'x']",
+    "$.BRP.persoon.voornamen is not 'Jan'",
+    "$.WMO.*[@.itemTypeCode not in ['AOV', 'WRA']].title",
+    "len($.WMO.*[@.isActual is false]) > 1 and $.BRP.persoon.mokum",
+    "yearsAgo($.BRP.persoon.geboortedatum) < 18 or not $.BRP.kinderen",
+    "$.BRP.kinderen.*[yearsAgo(@.geboortedatum) > 'a']",
+]
+
+
+def get_rules():
+    with open(TIPS_POOL_FILE) as fp:
+        tips_pool = json.load(fp)
+        fp.close()
+    with open(COMPOUND_RULES_FILE) as fp:
+        compound_rules = json.load(fp)
+        fp.close()
+
+    rules = list(EXTRA_RULES)
+    for rule_set in tips_pool + list(compound_rules.values()):
+        for rule in rule_set.get("rules", []):
+            if rule["type"] == "rule" and rule["rule"] not in rules:
+                rules.append(rule["rule"])
+    return rules
+
+
+def get_user_data_variations():
+    user_data = get_fixture(optin=True)["userData"]
+    variations = [user_data, {}, {"BRP": None}, {"BRP": {"kinderen": "ja"}}]
+
+    def vary(change):
+        data = copy.deepcopy(user_data)
+        change(data)
+        variations.append(data)
+
+    vary(lambda data: data.update({"WPI_STADSPAS": None, "WPI_TOZO": []}))
+    vary(lambda data: data["BRP"].update({"kinderen": [], "identiteitsbewijzen": []}))
+    vary(lambda data: data["BRP"]["persoon"].update({"mokum": False}))
+    vary(lambda data: data["BRP"]["persoon"].update({"nationaliteiten": []}))
+    vary(lambda data: data["BRP"]["persoon"].update({"geboortedatum": None}))
+    vary(lambda data: data["TOERISTISCHE_VERHUUR"].update({"registraties": []}))
+    vary(lambda data: data["WMO"][0].update({"isActual": "true"}))
+    vary(lambda data: data["WPI_AANVRAGEN"].append(None))
+
+    return variations
+
+
+def evaluate(function):
+    try:
+        result = function()
+    except Exception as error:
+        return type(error)
+    if type(result) in (generator, chain):
+        return ("generator", list(result))
+    return result
+
+
+@freeze_time("2021-05-09")
+class RuleCompilerTest(TestCase):
+    def test_same_result_as_objectpath(self):
+        """Differential test of the native rules against the objectpath interpreter."""
+        rules = get_rules()
+        variations = get_user_data_variations()
+        compared = 0
+
+        for rule in rules:
+            try:
+                native_rule = compile_native(compile_rule(rule))
+            except UnsupportedRule:
+                continue
+
+            for user_data in variations:
+                expected = evaluate(lambda: UserDataTree(user_data).execute(rule))
+                result = evaluate(lambda: native_rule(UserDataTree(user_data)))
+                self.assertEqual(expected, result, f"{rule} {user_data}")
+                compared += 1
+
+        # all rules except the ones using timeDelta are supported
+        supported = [rule for rule in rules if "timeDelta" not in rule]
+        self.assertEqual(compared, len(supported) * len(variations))
+
+    def test_unsupported(self):
+        native_rules = compile_native_rules(
+            {rule: compile_rule(rule) for rule in get_rules()}
+        )
+        unsupported = [rule for rule in get_rules() if rule not in native_rules]
+        self.assertEqual(len(unsupported), 4)
+        for rule in unsupported:
+            self.assertIn("timeDelta", rule)
+
+        for rule in ["$..a", "sum($.a)", "$.a.(b, c)", "$.a + 1"]:
+            with self.assertRaises(UnsupportedRule):
+                compile_native(compile_rule(rule))
+
+    def test_apply_rules(self):
+        native_rules = {"$.a": lambda tree: ["native"]}
+        rules = [{"type": "rule", "rule": "$.a"}]
+
+        with patch("tips.generator.rule_engine.native_rules", native_rules):
+            self.assertTrue(apply_rules(UserDataTree({"a": []}), rules, {}))
+
+        self.assertFalse(apply_rules(UserDataTree({"a": []}), rules, {}))
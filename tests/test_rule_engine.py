@@ -1,10 +1,20 @@
 import json
 import os
 from unittest import TestCase
+from unittest.mock import patch
 
 from tips.api.user_data_tree import UserDataTree
 from tips.config import PROJECT_PATH
-from tips.generator.rule_engine import apply_rules
+from tips.generator.rule_engine import (
+    apply_rules,
+    compile_rule,
+    compile_rules,
+    EvaluationContext,
+    order_rules,
+    RuleCompileError,
+    RuleStats,
+)
+from tests.fixtures.fixture import get_fixture
 
 COMPOUND_RULES_FILE = os.path.join(PROJECT_PATH, "api", "compound_rules.json")
 
@@ -109,3 +119,148 @@ class RuleEngineTest(TestCase):
         data = {"BRP": {"kinderen": []}}
 
         self.assertEqual(apply_rules(UserDataTree(data), rules, {}), True)
+
+    def test_compile_rules(self):
+        rules = [
+            {"type": "rule", "rule": "$.a"},
+            {"type": "ref", "ref_id": "1"},
+            {"type": "rule", "rule": "len($.b) is 3"},
+        ]
+        compiled_rules = compile_rules(rules)
+
+        self.assertEqual(sorted(compiled_rules.keys()), ["$.a", "len($.b) is 3"])
+
+        data = UserDataTree({"a": [], "b": [1, 2, 3]})
+        self.assertFalse(apply_rules(data, rules[:1], {}))
+        self.assertTrue(apply_rules(data, rules[2:], {}))
+
+    def test_compile_rule_invalid(self):
+        with self.assertRaises(RuleCompileError):
+            compile_rule("$.a[")
+
+        with self.assertRaises(RuleCompileError):
+            compile_rule("$.a is")
+
+    def test_apply_rules_context(self):
+        compound_rules = {
+            "1": {"name": "rule 1", "rules": [{"type": "rule", "rule": "$.a"}]},
+            "2": {"name": "rule 2", "rules": [{"type": "ref", "ref_id": "1"}]},
+        }
+        context = EvaluationContext()
+
+        rules = [{"type": "ref", "ref_id": "1"}]
+        self.assertTrue(apply_rules(self.test_data, rules, compound_rules, context))
+        self.assertEqual(context.hits, 0)
+        self.assertEqual(context.misses, 1)
+
+        rules = [{"type": "ref", "ref_id": "2"}, {"type": "ref", "ref_id": "1"}]
+        self.assertTrue(apply_rules(self.test_data, rules, compound_rules, context))
+        self.assertEqual(context.hits, 2)
+        self.assertEqual(context.misses, 2)
+        self.assertEqual(context.ref_results, {"1": True, "2": True})
+        self.assertEqual(context.hit_ratio(), 0.5)
+
+        # cached results are used, even when the data changes
+        self.test_data.data = {"a": []}
+        rules = [{"type": "ref", "ref_id": "1"}]
+        self.assertTrue(apply_rules(self.test_data, rules, compound_rules, context))
+        self.assertFalse(apply_rules(self.test_data, rules, compound_rules))
+
+    def test_apply_rules_short_circuit(self):
+        rules = [
+            {"type": "rule", "rule": "false"},
+            {"type": "rule", "rule": "$.a"},
+        ]
+        with patch.object(self.test_data, "execute", return_value=False) as execute:
+            self.assertFalse(apply_rules(self.test_data, rules, {}))
+        execute.assert_called_once_with("false")
+
+    def test_rule_stats(self):
+        stats = RuleStats()
+        stats.record(("rule", "$.a"), 0.5, [1])
+        stats.record(("rule", "$.a"), 1.5, [])
+
+        self.assertEqual(stats.counters[("rule", "$.a")], [2, 1, 2.0])
+        self.assertEqual(stats.cost(("rule", "$.a")), 1.0)
+        self.assertEqual(stats.pass_rate(("rule", "$.a")), 0.5)
+        self.assertFalse(stats.measured(("rule", "$.a")))
+
+    def test_measured_context(self):
+        compound_rules = {"1": {"rules": [{"type": "rule", "rule": "$.a"}]}}
+        rules = [{"type": "ref", "ref_id": "1"}, {"type": "rule", "rule": "$.c"}]
+        stats = RuleStats()
+
+        apply_rules(self.test_data, rules, compound_rules, EvaluationContext())
+        apply_rules(self.test_data, rules, compound_rules)
+        self.assertEqual(stats.samples, 0)
+
+        apply_rules(self.test_data, rules, compound_rules, EvaluationContext(stats))
+        self.assertEqual(
+            sorted(stats.counters), [("ref", "1"), ("rule", "$.a"), ("rule", "$.c")]
+        )
+        self.assertEqual(stats.counters[("rule", "$.c")][:2], [1, 0])
+        self.assertEqual(stats.samples, 3)
+
+    def test_order_rules_static(self):
+        compound_rules = {
+            "1": {"name": "rule 1", "rules": [{"type": "rule", "rule": "$.a"}]},
+        }
+        rules = [
+            {"type": "rule", "rule": "$.b.*[@.x is true and yearsAgo(@.y) > 1]"},
+            {"type": "rule", "rule": "len($.b) is 3"},
+            {"type": "ref", "ref_id": "1"},
+            {"type": "rule", "rule": "$.a"},
+        ]
+        ordered = order_rules(rules, compound_rules, stats=RuleStats())
+        self.assertEqual(ordered, [rules[2], rules[3], rules[1], rules[0]])
+
+    def test_order_rules_measured(self):
+        rules = [
+            {"type": "rule", "rule": "$.a"},
+            {"type": "rule", "rule": "$.b"},
+            {"type": "rule", "rule": "$.c"},
+        ]
+        stats = RuleStats()
+        for _ in range(20):
+            # cheap, but always passes
+            stats.record(("rule", "$.a"), 0.001, True)
+            # expensive, but fails most of the time
+            stats.record(("rule", "$.b"), 0.002, False)
+            stats.record(("rule", "$.c"), 0.003, _ % 4 == 0)
+
+        ordered = order_rules(rules, {}, stats=stats)
+        self.assertEqual(ordered, [rules[1], rules[2], rules[0]])
+
+        # rules without enough measurements are ordered on their static cost
+        rules.append({"type": "rule", "rule": "len($.d) > 1"})
+        ordered = order_rules(rules, {}, stats=stats)
+        self.assertEqual(ordered, rules)
+
+    def test_order_rules_same_result(self):
+        compound_rules = get_compound_rules()
+        user_data = UserDataTree(get_fixture(optin=True)["userData"])
+
+        for ref_id in compound_rules:
+            rules = compound_rules[ref_id]["rules"]
+            ordered = order_rules(rules, compound_rules, stats=RuleStats())
+            self.assertCountEqual(ordered, rules)
+            self.assertEqual(
+                apply_rules(user_data, ordered, compound_rules),
+                apply_rules(user_data, rules, compound_rules),
+            )
+
+    def test_apply_rules_first_match(self):
+        consumed = []
+
+        def matches():
+            for item in self.test_data.data["b"]:
+                consumed.append(item)
+                yield item
+
+        rules = [{"type": "rule", "rule": "$.b.*[@.x is true]"}]
+        with patch.object(self.test_data, "execute", return_value=matches()):
+            self.assertTrue(apply_rules(self.test_data, rules, {}))
+        self.assertEqual(len(consumed), 1)
+
+        rules = [{"type": "rule", "rule": "$.b.*[@.x is 'y']"}]
+        self.assertFalse(apply_rules(self.test_data, rules, {}))
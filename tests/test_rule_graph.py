@@ -0,0 +1,107 @@
+from unittest import TestCase
+
+from tips.api import tip_generator
+from tips.generator.rule_graph import RuleGraph, RuleGraphError
+from tests.test_rule_engine import get_compound_rules
+
+
+def ref(ref_id):
+    return {"type": "ref", "ref_id": ref_id}
+
+
+def rule(rule):
+    return {"type": "rule", "rule": rule}
+
+
+def get_reasoning(tip, compound_rules):
+    """The reasons of a tip, recursively."""
+    reasons = [tip["reason"]] if tip.get("reason") else []
+    for tip_rule in tip.get("rules", []):
+        if tip_rule["type"] == "ref":
+            reasons.extend(
+                get_reasoning(compound_rules[tip_rule["ref_id"]], compound_rules)
+            )
+    return reasons
+
+
+class RuleGraphTest(TestCase):
+    compound_rules = {
+        "a": {"rules": [rule("$.a is 1"), ref("b"), ref("c")], "reason": "A"},
+        "b": {"rules": [ref("c"), rule("$.b.x is 1")], "reason": "B"},
+        "c": {"rules": [rule("$.c is 1")], "reason": "C"},
+        "d": {"rules": [rule("$.d is 1")]},
+    }
+
+    def test_order(self):
+        graph = RuleGraph(self.compound_rules)
+
+        order = graph.order
+        self.assertEqual(sorted(order), ["a", "b", "c", "d"])
+        self.assertLess(order.index("c"), order.index("b"))
+        self.assertLess(order.index("b"), order.index("a"))
+        self.assertEqual(graph.refs["a"], {"b", "c"})
+        self.assertEqual(graph.refs["c"], set())
+
+    def test_reasons(self):
+        graph = RuleGraph(self.compound_rules)
+
+        self.assertEqual(graph.reasons["a"], ("A", "B", "C", "C"))
+        self.assertEqual(graph.rules_reasons([ref("b"), ref("d")]), ["B", "C"])
+
+        compound_rules = get_compound_rules()
+        graph = RuleGraph(compound_rules)
+        for ref_id, compound_rule in compound_rules.items():
+            self.assertEqual(
+                list(graph.reasons[ref_id]),
+                get_reasoning(compound_rule, compound_rules),
+                ref_id,
+            )
+
+    def test_paths(self):
+        graph = RuleGraph(self.compound_rules)
+
+        self.assertEqual(
+            graph.rules_paths([ref("b"), rule("$.e is 1")]),
+            {"b": {"x": None}, "c": None, "e": None},
+        )
+        tips = [{"id": "1", "rules": [ref("d")]}, {"id": "2"}]
+        self.assertEqual(graph.tips_paths(tips), {"d": None})
+
+    def test_dependent_tips(self):
+        tips = [
+            {"id": "1", "rules": [ref("a")]},
+            {"id": "2", "rules": [ref("c"), rule("$.x is 1")]},
+            {"id": "3"},
+        ]
+        graph = RuleGraph(self.compound_rules, tips=tips)
+
+        self.assertEqual(graph.tips_depending_on("a"), ["1"])
+        self.assertEqual(graph.tips_depending_on("c"), ["1", "2"])
+        self.assertEqual(graph.tips_depending_on("d"), [])
+
+    def test_errors(self):
+        compound_rules = {
+            "a": {"rules": [ref("b")]},
+            "b": {"rules": [ref("c")]},
+            "c": {"rules": [ref("a")]},
+        }
+        with self.assertRaisesRegex(RuleGraphError, "a -> b -> c -> a"):
+            RuleGraph(compound_rules)
+
+        with self.assertRaisesRegex(RuleGraphError, "unknown rule x"):
+            RuleGraph({"a": {"rules": [ref("x")]}})
+
+        with self.assertRaisesRegex(RuleGraphError, "Tip 1 refers to unknown rule x"):
+            RuleGraph({}, tips=[{"id": "1", "rules": [ref("x")]}])
+
+    def test_rule_set(self):
+        """The reasons of the tips in the pool are the reasons of their compound rules."""
+        rule_set = tip_generator.rule_set
+        source = {tip["id"]: tip for tip in rule_set.pool}
+
+        for tip in rule_set.index.tips:
+            if not source[tip["id"]].get("reason"):
+                self.assertEqual(
+                    list(tip["reason"]),
+                    get_reasoning(source[tip["id"]], rule_set.compound_rules),
+                )
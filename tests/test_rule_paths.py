@@ -0,0 +1,72 @@
+from unittest import TestCase
+
+from freezegun import freeze_time
+
+from tips.api.user_data_tree import UserDataTree
+from tips.generator.rule_engine import compile_rule
+from tips.generator.rule_paths import merge_paths, prune, referenced_paths, rule_paths
+from tips.server import get_tips_request_data
+from tests.test_rule_compiler import evaluate, get_rules, get_user_data_variations
+
+
+class RulePathsTest(TestCase):
+    def test_rule_paths(self):
+        def paths(rule):
+            return sorted(rule_paths(compile_rule(rule)))
+
+        self.assertEqual(paths("$.a.b is true"), [("a", "b")])
+        self.assertEqual(paths("len($.a.*[@.b is 1]) > len($.c)"), [("a",), ("c",)])
+        self.assertEqual(paths("yearsAgo($.a[0].b) > 1"), [("a",)])
+        self.assertEqual(paths("$.a[@.b is $.c.d]"), [("a",), ("c", "d")])
+        self.assertEqual(paths("$..a"), [()])
+        self.assertEqual(paths("$.* is 1"), [()])
+        self.assertEqual(paths("2 > 1"), [])
+
+    def test_merge_paths(self):
+        self.assertEqual(
+            merge_paths([("a", "b", "c"), ("a", "b"), ("a", "d"), ("e",)]),
+            {"a": {"b": None, "d": None}, "e": None},
+        )
+        self.assertEqual(merge_paths([("a",), ()]), None)
+        self.assertEqual(merge_paths([]), {})
+
+    def test_prune(self):
+        data = {
+            "a": [{"b": 1, "c": 2}, {"c": 3}, "x"],
+            "d": {"e": {"f": 4}, "g": 5},
+            "h": 6,
+        }
+        paths = {"a": {"b": None}, "d": {"e": None}, "i": None}
+
+        self.assertEqual(
+            prune(data, paths), {"a": [{"b": 1}, {}, "x"], "d": {"e": {"f": 4}}}
+        )
+        self.assertIs(prune(data, None), data)
+        self.assertEqual(prune(data, {}), {})
+
+    @freeze_time("2021-05-09")
+    def test_same_result_as_unpruned(self):
+        """Every rule gives the same result on the user data pruned to the paths of all rules."""
+        rules = get_rules()
+        paths = referenced_paths({rule: compile_rule(rule) for rule in rules})
+
+        for user_data in get_user_data_variations():
+            pruned = prune(user_data, paths)
+            for rule in rules:
+                expected = evaluate(lambda: UserDataTree(user_data).execute(rule))
+                result = evaluate(lambda: UserDataTree(pruned).execute(rule))
+                self.assertEqual(expected, result, rule)
+
+    def test_get_tips_request_data(self):
+        request_data = {"optin": True, "userData": {"a": {"b": 1, "c": 2}, "d": 3}}
+        paths = {"a": {"b": None}}
+
+        self.assertEqual(
+            get_tips_request_data(request_data)["user_data"], request_data["userData"]
+        )
+        self.assertEqual(
+            get_tips_request_data(request_data, paths)["user_data"], {"a": {"b": 1}}
+        )
+
+        request_data["optin"] = False
+        self.assertEqual(get_tips_request_data(request_data, paths)["user_data"], {})
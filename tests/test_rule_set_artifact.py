@@ -0,0 +1,99 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from tips.api import tip_generator
+from tips.api.rule_set_artifact import (
+    ARTIFACT_FORMAT,
+    load_artifact,
+    read_sources,
+    source_hashes,
+)
+from tips.api.tip_generator import (
+    RuleSet,
+    build_rule_set_artifact,
+    content_files,
+    load_rule_set,
+    reload_content,
+)
+
+
+class RuleSetArtifactTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "rule_set.pickle")
+
+    def test_load(self):
+        built = build_rule_set_artifact(self.path)
+
+        loaded = load_rule_set(self.path)
+        self.assertIsInstance(loaded, RuleSet)
+        self.assertIsNot(loaded, built)
+        self.assertEqual(loaded.version, built.version)
+        self.assertEqual(loaded.index.records, built.index.records)
+        self.assertEqual(
+            [record.encoded for record in loaded.index.records],
+            [record.encoded for record in built.index.records],
+        )
+        self.assertEqual(loaded.rule_graph.reasons, built.rule_graph.reasons)
+        with self.assertRaises(AttributeError):
+            loaded.version = ""
+
+    def test_fallback(self):
+        # missing
+        rule_set = load_rule_set(self.path)
+        self.assertEqual(rule_set.version, tip_generator.rule_set.version)
+
+        # built from other sources
+        build_rule_set_artifact(self.path)
+        with open(self.path, "rb") as fp:
+            artifact = pickle.load(fp)
+        artifact["sources"]["tips_pool.json"] = "other"
+        with open(self.path, "wb") as fp:
+            pickle.dump(artifact, fp)
+        self.assertIsNone(load_artifact(self.path, {}))
+        self.assertIsNot(load_rule_set(self.path), artifact["value"])
+
+        # built by another version
+        artifact["format"] = ARTIFACT_FORMAT + 1
+        with open(self.path, "wb") as fp:
+            pickle.dump(artifact, fp)
+        self.assertIsNot(load_rule_set(self.path), artifact["value"])
+
+        # built by other code, or with another version of objectpath
+        artifact["format"] = ARTIFACT_FORMAT
+        artifact["sources"] = source_hashes(read_sources(content_files()))
+        artifact["code"] = "other"
+        with open(self.path, "wb") as fp:
+            pickle.dump(artifact, fp)
+        self.assertIsNone(load_artifact(self.path, artifact["sources"]))
+        self.assertIsNot(load_rule_set(self.path), artifact["value"])
+
+        build_rule_set_artifact(self.path)
+        self.assertIsNotNone(load_artifact(self.path, artifact["sources"]))
+        with patch("importlib.metadata.version", return_value="0.0"):
+            self.assertIsNone(load_artifact(self.path, artifact["sources"]))
+
+        # corrupt
+        with open(self.path, "wb") as fp:
+            fp.write(b"corrupt")
+        with self.assertLogs(level="WARNING"):
+            rule_set = load_rule_set(self.path)
+        self.assertEqual(rule_set.version, tip_generator.rule_set.version)
+
+    def test_reload_content(self):
+        built = build_rule_set_artifact(self.path)
+        self.addCleanup(reload_content)
+
+        # the rules are not compiled again when the artifact is used
+        with patch.object(
+            tip_generator, "get_rule_set_artifact_path", return_value=self.path
+        ), patch.object(
+            tip_generator, "compile_content_rules", side_effect=AssertionError
+        ):
+            reload_content()
+        self.assertEqual(tip_generator.rule_set.version, built.version)
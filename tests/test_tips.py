@@ -3,11 +3,22 @@ from unittest.mock import patch
 from flask_testing import TestCase
 from freezegun import freeze_time
 
-from tips.api.tip_generator import tips_pool
+from tips.api import tip_generator
+from tips.api.tip_generator import RuleSet
 from tips.server import application
 from tests.fixtures.fixture import get_fixture_without_source_tips, get_fixture
 
 
+def pool_rule_set(tips):
+    """Use a rule set with only these tips in its pool."""
+    current = tip_generator.rule_set
+    return patch.object(
+        tip_generator,
+        "rule_set",
+        RuleSet(tips, current.enrichments, current.compound_rules),
+    )
+
+
 class ApiTests(TestCase):
     def create_app(self):
         app = application
@@ -49,14 +60,16 @@ class ApiTests(TestCase):
 
     @freeze_time("2021-01-01")
     def test_moved_to_amsterdam(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-16"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-16"
+        ]
 
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Welkom in Amsterdam")
 
         client_data = self._get_client_data()
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             # Previous city is Amsterdam: fail
             response = self.client.post("/tips/gettips", json=client_data)
             self.assertEqual(len(response.get_json()), 0)
@@ -89,14 +102,16 @@ class ApiTests(TestCase):
 
     @freeze_time("2021-03-09")
     def test_laat_geen_geld_liggen(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-22"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-22"
+        ]
 
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Laat geen geld liggen")
 
         client_data = self._get_client_data()
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             response = self.client.post("/tips/gettips", json=client_data)
             json = response.get_json()
             self.assertEqual(len(json), 1)
@@ -110,14 +125,16 @@ class ApiTests(TestCase):
 
     @freeze_time("2021-03-09")
     def test_020werkt(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-23"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-23"
+        ]
 
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Download de 020werkt-app")
 
         client_data = self._get_client_data()
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             response = self.client.post("/tips/gettips", json=client_data)
             json = response.get_json()
             self.assertEqual(len(json), 1)
@@ -155,13 +172,15 @@ class ApiTests(TestCase):
             self.assertEqual(len(json), 1)
 
     def test_draag_uw_mondkapje(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-24"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-24"
+        ]
 
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Draag uw mondkapje")
 
         client_data = self._get_client_data()
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             response = self.client.post("/tips/gettips", json=client_data)
             json = response.get_json()
             self.assertEqual(len(json), 1)
@@ -178,14 +197,16 @@ class ApiTests(TestCase):
 
     @freeze_time("2021-03-09")
     def test_ID_voor_stemmen(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-27"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-27"
+        ]
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Gratis ID-kaart om te stemmen")
 
         # user must not have a valid id
         # user must have stadspas groene met stip
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             client_data = self._get_client_data()
 
             # set both identiteitsbewijzen to be expired before election date
@@ -230,11 +251,13 @@ class ApiTests(TestCase):
 
     @freeze_time("2018-07-15")
     def test_pingping(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-28"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-28"
+        ]
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Breng je basis op orde")
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             client_data = self._get_client_data()
 
             # exactly 18
@@ -279,11 +302,13 @@ class ApiTests(TestCase):
 
     @freeze_time("2021-08-15")
     def test_vakantie_verhuur(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-33"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-33"
+        ]
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Particuliere vakantieverhuur")
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             client_data = self._get_client_data()
 
             # Initial state has vakantieverhuurvergunnings aanvraag and registratienummer
@@ -319,11 +344,13 @@ class ApiTests(TestCase):
             self.assertEqual(len(json), 0)
 
     def test_bb_vergunning(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-34"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-34"
+        ]
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Overgangsrecht bij Bed and breakfast")
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             client_data = self._get_client_data()
 
             # Initial state BB result is 'geweigerd'
@@ -355,11 +382,13 @@ class ApiTests(TestCase):
             self.assertEqual(len(json), 0)
 
     def test_bb_vergunning_personal(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-35"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-35"
+        ]
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Bed & breakfast")
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             client_data = self._get_client_data()
 
             # Initial state has b&b-vergunning and registratienummer
@@ -399,11 +428,13 @@ class ApiTests(TestCase):
 
     @freeze_time("2021-08-15")
     def test_sportvergoeding_kinderen_personal(self):
-        new_pool = [tip for tip in tips_pool if tip["id"] == "mijn-36"]
+        new_pool = [
+            tip for tip in tip_generator.rule_set.pool if tip["id"] == "mijn-36"
+        ]
         self.assertEqual(len(new_pool), 1)
         self.assertEqual(new_pool[0]["title"], "Sportvergoeding voor kinderen")
 
-        with patch("tips.api.tip_generator.tips_pool", new_pool):
+        with pool_rule_set(new_pool):
             client_data = self._get_client_data()
 
             # Initial state has Tozo and Tonk with intrekking and bijstands and stadspas
@@ -1,15 +1,23 @@
+from datetime import date
+
 from tips.api.user_data_tree import UserDataTree
 from unittest import TestCase
+from unittest.mock import patch
 
 from freezegun import freeze_time
 
 from tips.api.tip_generator import (
     tip_filter,
+    tips_batch_generator,
     tips_generator,
     fix_id,
     format_tip,
     format_source_tips,
+    get_user_data_tree,
+    index_tip_enrichments,
+    parallel_tips_generator,
     FRONT_END_TIP_KEYS,
+    TipsIndex,
 )
 from tests.fixtures.fixture import get_fixture, get_fixture_without_source_tips
 from tips.server import get_tips_request_data
@@ -85,6 +93,96 @@ class TipsGeneratorTest(TestCase):
         self.assertEqual(tips[1]["id"], tip2["id"])
         self.assertEqual(tips[0]["id"], tip3["id"])
 
+    def test_generator_limit(self):
+        tip0 = get_tip(10)
+        # evaluating this rule would raise a KeyError
+        tip0["rules"] = [{"type": "ref", "ref_id": "does-not-exist"}]
+        tip1 = get_tip(20)
+        tip2 = get_tip(30)
+        tip2["rules"] = [new_rule("false")]
+        tip3 = get_tip(40)
+
+        tips_pool = [tip0, tip1, tip2, tip3]
+        for tip in tips_pool:
+            tip["isPersonalized"] = True
+
+        client_data = get_tips_request_data(get_fixture_without_source_tips(True))
+        client_data["source_tips"] = [
+            {"id": "source-1", "priority": 20},
+            {"id": "source-2", "priority": 50},
+        ]
+
+        tips = tips_generator(client_data, tips_pool, limit=3)
+        self.assertEqual(
+            [tip["id"] for tip in tips], ["source-2", tip3["id"], tip1["id"]]
+        )
+
+        tips = tips_generator(client_data, tips_pool, limit=1, offset=2)
+        self.assertEqual([tip["id"] for tip in tips], [tip1["id"]])
+
+        with self.assertRaises(KeyError):
+            tips_generator(client_data, tips_pool)
+
+    @freeze_time("2022-03-03")
+    def test_parallel_generator(self):
+        bodies = [get_fixture(optin=optin) for optin in (True, False, True, False)]
+        expected = [tips_generator(get_tips_request_data(body)) for body in bodies]
+
+        tips = parallel_tips_generator(iter(bodies), processes=2, chunksize=1)
+
+        self.assertEqual(list(tips), expected)
+
+
+class TipsIndexTest(TestCase):
+    def test_candidates(self):
+        tip0 = get_tip()
+        tip0["audience"] = ["zakelijk"]
+        tip1 = get_tip()
+        tip1["audience"] = ["persoonlijk", "zakelijk"]
+        tip1["isPersonalized"] = True
+        tip2 = get_tip()
+        tip2["audience"] = ["persoonlijk"]
+        tip2["isPersonalized"] = True
+        tip2["alwaysVisible"] = True
+        tip3 = get_tip()
+
+        index = TipsIndex([tip0, tip1, tip2, tip3])
+
+        self.assertEqual(index.candidates(False), [0, 2, 3])
+        self.assertEqual(index.candidates(True), [1, 2])
+        self.assertEqual(index.candidates(False, ["zakelijk"]), [0])
+        self.assertEqual(index.candidates(True, ["persoonlijk"]), [1, 2])
+        self.assertEqual(index.candidates(True, ["persoonlijk", "zakelijk"]), [1, 2])
+        self.assertEqual(index.candidates(False, ["somethingelse"]), [])
+
+        # the given tips are not modified
+        self.assertNotIn("isPersonalized", tip0)
+        self.assertEqual(index.tips[0]["isPersonalized"], False)
+        self.assertEqual(index.records[0]["isPersonalized"], False)
+        with self.assertRaises(TypeError):
+            index.records[0]["title"] = "changed"
+
+    def test_active_positions(self):
+        tip0 = get_tip()
+        tip0["dateActiveStart"] = "2021-03-14"
+        tip0["dateActiveEnd"] = "2021-03-16"
+        tip1 = get_tip()
+        tip1["dateActiveEnd"] = "2021-03-14"
+        tip2 = get_tip()
+        tip2["active"] = False
+
+        index = TipsIndex([tip0, tip1, tip2])
+
+        self.assertEqual(index.active_positions(date(2021, 3, 13)), {1})
+        self.assertEqual(index.active_positions(date(2021, 3, 14)), {0, 1})
+        # only recomputed when the day changes
+        active_positions = index.active_positions(date(2021, 3, 15))
+        self.assertEqual(active_positions, {0})
+        self.assertIs(index.active_positions(date(2021, 3, 15)), active_positions)
+
+        self.assertEqual(index.candidates(False, today=date(2021, 3, 17)), [])
+        self.assertEqual(index.candidates(False, today=date(2021, 3, 15)), [0])
+
 
 class ConditionalTest(TestCase):
     def get_client_data(self, optin=False):
@@ -349,6 +447,15 @@ class SourceTipsTests(TestCase):
         fix_id(other_tip, "something else")
         self.assertEqual(other_tip["id"], "1")
 
+    def test_index_tip_enrichments(self):
+        enrichment1 = {"id": "1", "for_ids": ["a", "b"], "fields": {"imgUrl": "1"}}
+        enrichment2 = {"id": "2", "for_ids": ["b", "c"], "fields": {"imgUrl": "2"}}
+
+        result = index_tip_enrichments([enrichment1, enrichment2])
+
+        # the first enrichment for a tip wins
+        self.assertEqual(result, {"a": enrichment1, "b": enrichment1, "c": enrichment2})
+
     def test_tip_filter(self):
         tip1 = {"isPersonalized": True}
         optin = False
@@ -376,3 +483,35 @@ class SourceTipsTests(TestCase):
         showTip = tip_filter(tip1, UserDataTree({}), optin)
 
         self.assertEqual(showTip, True)
+
+    def test_tip_filter_no_optin(self):
+        tip1 = {
+            "isPersonalized": False,
+            "active": True,
+            "rules": [new_rule("not $.BRP")],
+        }
+        self.assertEqual(tip_filter(tip1, None, False), True)
+
+        tip1["rules"] = [new_rule("$.BRP")]
+        self.assertEqual(tip_filter(tip1, None, False), False)
+
+    def test_one_empty_tree_per_request(self):
+        request_data = get_tips_request_data(get_fixture(optin=False))
+
+        # the rules are evaluated for every request, not looked up in the result cache
+        with patch("tips.api.tip_generator.result_cache", None), patch(
+            "tips.api.tip_generator.UserDataTree", wraps=UserDataTree
+        ) as user_data_tree:
+            tips_generator(request_data)
+            self.assertEqual(user_data_tree.call_count, 1)
+
+            user_data_tree.reset_mock()
+            tips_batch_generator([request_data, request_data])
+            self.assertEqual(user_data_tree.call_count, 2)
+
+    def test_get_user_data_tree(self):
+        request_data = {"optin": False, "user_data": {"BRP": {}}}
+        self.assertIsNone(get_user_data_tree(request_data))
+
+        request_data["optin"] = True
+        self.assertEqual(get_user_data_tree(request_data).data, {"BRP": {}})
@@ -0,0 +1,72 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from dateutil import parser
+from freezegun import freeze_time
+
+from tips.api.user_data_tree import strToUtcDateTime, UserDataTree
+from tips.generator.rule_compiler import compile_native_rules
+from tips.generator.rule_engine import compile_rule
+
+
+class UserDataTreeTest(TestCase):
+    def test_dates_memoized(self):
+        tree = UserDataTree({"a": "1950-01-01T00:00:00Z", "b": "1950-01-01T00:00:00Z"})
+
+        with freeze_time("2021-05-09"), patch(
+            "tips.api.user_data_tree.parser.isoparse", wraps=parser.isoparse
+        ) as isoparse:
+            self.assertTrue(tree.execute("yearsAgo($.a) is 71"))
+            self.assertTrue(tree.execute("yearsAgo($.b) > 70"))
+        isoparse.assert_called_once()
+
+        self.assertEqual(
+            tree.execute("strToUtcDateTime($.a)"), strToUtcDateTime(tree.data["a"])
+        )
+        self.assertIs(
+            tree.execute("strToUtcDateTime($.a)"), tree.execute("strToUtcDateTime($.b)")
+        )
+
+    def test_today_fixed(self):
+        with freeze_time("2021-05-09"):
+            tree = UserDataTree({"a": "2020-05-10"})
+            self.assertEqual(tree.execute("yearsAgo($.a)"), 0)
+
+        # the day of the request does not change while the tree is used
+        with freeze_time("2021-05-10"):
+            self.assertEqual(tree.execute("yearsAgo($.a)"), 0)
+            self.assertEqual(str(tree.execute("today()")), "2021-05-09")
+            self.assertEqual(
+                UserDataTree({"a": "2020-05-10"}).execute("yearsAgo($.a)"), 1
+            )
+
+    def test_now_fixed(self):
+        rule = "now() > $.a"
+        compiled_rules = {rule: compile_rule(rule)}
+
+        with freeze_time("2021-05-09 12:00:00"):
+            tree = UserDataTree({"a": strToUtcDateTime("2021-05-10")})
+            first = tree.execute("now()")
+            self.assertFalse(tree.execute(rule))
+
+        # now() is the same instant for all rules executed on a tree, on both backends
+        with freeze_time("2021-05-12 12:00:00"):
+            self.assertEqual(tree.execute("now()"), first)
+            self.assertFalse(tree.execute(rule))
+            self.assertFalse(compile_native_rules(compiled_rules)[rule](tree))
+            self.assertNotEqual(UserDataTree({}).execute("now()"), first)
+
+    def test_functions_per_tree(self):
+        tree = UserDataTree({})
+        other = UserDataTree({})
+
+        self.assertIs(tree._REGISTERED_FUNCTIONS["yearsAgo"].__self__, tree)
+        self.assertIs(other._REGISTERED_FUNCTIONS["yearsAgo"].__self__, other)
+        self.assertNotIn("yearsAgo", UserDataTree._REGISTERED_FUNCTIONS)
+
+        # functions registered on objectpath are available to all trees
+        with patch.dict(
+            UserDataTree._REGISTERED_FUNCTIONS, {"double": lambda x: x * 2}
+        ):
+            self.assertIn("double", tree._REGISTERED_FUNCTIONS)
+            self.assertEqual(UserDataTree({"a": 2}).execute("double($.a)"), 4)
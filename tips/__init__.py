@@ -0,0 +1,3 @@
+from tips.preload import start_preload
+
+start_preload()
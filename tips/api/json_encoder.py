@@ -0,0 +1,37 @@
+"""
+Encodes the tips of a response to json bytes.
+
+Pool tips are encoded once when the pool is loaded, they carry their encoding in the attribute
+"encoded". Only the tips without an encoding are encoded per request. orjson is used when it is
+installed, otherwise the json module.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def encode(value) -> bytes:
+    """Compact json with sorted keys."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        value, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+    ).encode("utf-8")
+
+
+def encode_tips(tips) -> bytes:
+    """A json array of the tips, using the encoding a tip carries when it has one."""
+    fragments = []
+    for tip in tips:
+        encoded = getattr(tip, "encoded", None)
+        fragments.append(encode(tip) if encoded is None else encoded)
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def encode_tips_batch(results) -> bytes:
+    """A json array of the tips for every request of a batch."""
+    return b"[" + b",".join(encode_tips(tips) for tips in results) + b"]"
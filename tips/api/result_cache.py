@@ -0,0 +1,226 @@
+"""
+Cache of the pool tips which passed their rules, for requests with the same rule relevant data.
+
+The key is a digest of the user data pruned to the paths the rules read, with the optin, the
+audience, the day and the version of the tips pool and rules. The user data itself is never
+stored. Backends:
+- MemoryCache: in process LRU cache, the default.
+- SQLiteCache: a local SQLite file, shared by all worker processes on the host.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+
+from tips.api.json_encoder import encode
+from tips.generator.rule_paths import prune
+
+
+def result_cache_key(request_data, audience, today, paths=None, version=""):
+    """The key of a request, the user data is pruned to the paths before it is hashed."""
+    user_data = request_data["user_data"] if request_data["optin"] else {}
+    key = hashlib.sha256(encode(prune(user_data, paths)))
+    key.update(
+        encode(
+            [
+                version,
+                bool(request_data["optin"]),
+                sorted(set(audience or [])),
+                today.isoformat(),
+            ]
+        )
+    )
+    return key.hexdigest()
+
+
+class CacheBackend:
+    """Interface of the result cache backends, keys are strings and values json values."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """The cached value, None when it is not cached or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        """
+        Called when the tips pool or rules change. The keys contain the version, so older
+        results are never used again, backends may drop them to free memory.
+        """
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / lookups
+
+
+class MemoryCache(CacheBackend):
+    """In process LRU cache with a time to live, safe to use from multiple threads."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expires, value), least recently used first
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] <= monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    invalidate = clear
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    LRU cache with a time to live in a SQLite file, shared by all processes which use the same
+    file. Every thread of every process gets its own connection. The counters are per process.
+
+    The cache is best effort: an error of SQLite, like a database which stays locked, counts as
+    a miss and is logged. To keep reads from taking the write lock, the time a result was used
+    is only updated when it is older than touch_interval seconds, and the expired and least
+    recently used results are only removed every evict_interval sets of a process, so the
+    number of results may exceed maxsize a bit in between.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        maxsize: int,
+        ttl: float,
+        touch_interval: float = None,
+        evict_interval: int = 32,
+    ):
+        super().__init__()
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.touch_interval = ttl / 10 if touch_interval is None else touch_interval
+        self.evict_interval = evict_interval
+        self._sets = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        # connections can not be used in a forked process, reconnect when the pid changes
+        pid, connection = getattr(self._local, "connection", (None, None))
+        if pid != os.getpid():
+            # do not wait long for a lock, a miss is cheaper
+            connection = sqlite3.connect(self.path, timeout=0.1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+            )
+            self._local.connection = (os.getpid(), connection)
+        return connection
+
+    def get(self, key):
+        try:
+            connection = self._connection()
+            now = time()
+            row = connection.execute(
+                "SELECT value, used FROM results WHERE key = ? AND expires > ?",
+                (key, now),
+            ).fetchone()
+            if row is not None and now - row[1] >= self.touch_interval:
+                connection.execute(
+                    "UPDATE results SET used = ? WHERE key = ?", (now, key)
+                )
+        except sqlite3.Error:
+            logging.warning("Result cache lookup failed", exc_info=True)
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        try:
+            connection = self._connection()
+            now = time()
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            self._sets += 1
+            if self._sets % self.evict_interval == 0:
+                connection.execute("DELETE FROM results WHERE expires <= ?", (now,))
+                connection.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                )
+        except sqlite3.Error:
+            logging.warning("Result cache update failed", exc_info=True)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM results")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+def private_directory(path: str):
+    """
+    Create the directory only this user can use. Returns False when it exists but another
+    user owns it or can write to it, then the files in it can not be trusted.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    status = os.stat(path)
+    return status.st_uid == os.getuid() and not status.st_mode & 0o022
+
+
+def create_result_cache(backend: str, maxsize: int, ttl: float, path: str = None):
+    """The result cache, None when the sqlite cache can not be used safely."""
+    if backend == "sqlite":
+        directory = os.path.dirname(os.path.abspath(path))
+        if not private_directory(directory):
+            logging.error(
+                "Result cache disabled, %s is not private to this user", directory
+            )
+            return None
+        return SQLiteCache(path, maxsize, ttl)
+    return MemoryCache(maxsize, ttl)
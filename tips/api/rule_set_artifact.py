@@ -0,0 +1,125 @@
+"""
+Precompiled rule set artifact, so a worker does not have to parse the json content and compile
+and index the rules when it starts.
+
+The artifact is a pickle of the RuleSet, with the sha256 digests of the source files it was
+built from and a fingerprint of the code which built it. It is only used when both still match,
+otherwise the rule set is built from the json sources. The artifact is build output which is trusted like the
+code, it is never read from a location users can write to.
+
+Build it with: python -m tips.api.rule_set_artifact [path]
+"""
+
+import hashlib
+import importlib.metadata
+import importlib.util
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+# changes when the contents of the artifact change, older artifacts are ignored
+ARTIFACT_FORMAT = 1
+
+# the modules which build the rule set or define the objects in it, a change of their code may
+# change the compiled rules or the pickled objects without a change of ARTIFACT_FORMAT
+CODE_MODULES = (
+    "tips.api.rule_set_artifact",
+    "tips.api.tip_generator",
+    "tips.api.user_data_tree",
+    "tips.generator.rule_compiler",
+    "tips.generator.rule_engine",
+    "tips.generator.rule_graph",
+    "tips.generator.rule_paths",
+)
+
+
+def read_sources(paths):
+    """Map of path -> the contents of the file."""
+    sources = {}
+    for path in paths:
+        with open(path, "rb") as fp:
+            sources[path] = fp.read()
+    return sources
+
+
+def source_hashes(sources):
+    """Map of file name -> sha256 of the contents, the directory does not matter."""
+    return {
+        os.path.basename(path): hashlib.sha256(contents).hexdigest()
+        for path, contents in sources.items()
+    }
+
+
+def code_fingerprint():
+    """sha256 of the code of CODE_MODULES and the version of objectpath, which parses the rules."""
+    digest = hashlib.sha256(importlib.metadata.version("objectpath").encode())
+    for name in CODE_MODULES:
+        with open(importlib.util.find_spec(name).origin, "rb") as fp:
+            digest.update(hashlib.sha256(fp.read()).digest())
+    return digest.hexdigest()
+
+
+def write_artifact(path, value, hashes):
+    """Write the artifact at once, a reader sees the old or the new artifact."""
+    data = pickle.dumps(
+        {
+            "format": ARTIFACT_FORMAT,
+            "code": code_fingerprint(),
+            "sources": hashes,
+            "value": value,
+        },
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load_artifact(path, hashes):
+    """
+    The value of the artifact, in a single read. None when there is no artifact, or when it was
+    built from other sources or by another version of the code.
+    """
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        artifact = pickle.loads(data)
+    except Exception:
+        logging.warning("Rule set artifact %s can not be loaded", path, exc_info=True)
+        return None
+
+    if (
+        not isinstance(artifact, dict)
+        or artifact.get("format") != ARTIFACT_FORMAT
+        or artifact.get("code") != code_fingerprint()
+        or artifact.get("sources") != hashes
+    ):
+        logging.info("Rule set artifact %s is stale", path)
+        return None
+    return artifact["value"]
+
+
+def main(argv=None):  # pragma: no cover
+    from tips.api import tip_generator
+    from tips.config import get_rule_set_artifact_path
+
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else get_rule_set_artifact_path()
+    rule_set = tip_generator.build_rule_set_artifact(path)
+    print(f"Wrote rule set {rule_set.version} to {path}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
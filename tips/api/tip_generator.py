@@ -1,11 +1,47 @@
+import hashlib
+import heapq
 import json
+import logging
+import multiprocessing
 import os
+import random
+import sys
+import threading
 from datetime import date, datetime
+from functools import partial
+from itertools import islice
 from typing import List
 
+from objectpath.core.interpreter import EXPR_CACHE
+
+from tips.api.json_encoder import encode
+from tips.api.result_cache import create_result_cache, result_cache_key
+from tips.api.rule_set_artifact import (
+    load_artifact,
+    read_sources,
+    source_hashes,
+    write_artifact,
+)
 from tips.api.user_data_tree import UserDataTree
-from tips.config import PROJECT_PATH
-from tips.generator.rule_engine import apply_rules
+from tips.config import (
+    PROJECT_PATH,
+    get_result_cache_backend,
+    get_result_cache_path,
+    get_result_cache_size,
+    get_result_cache_ttl,
+    get_rule_backend,
+    get_rule_set_artifact_path,
+)
+from tips.generator import rule_engine
+from tips.generator.rule_compiler import compile_native_rules
+from tips.generator.rule_graph import RuleGraph
+from tips.generator.rule_paths import prune
+from tips.generator.rule_engine import (
+    apply_rules,
+    compile_rules,
+    EvaluationContext,
+    order_rules,
+)
 
 TIPS_POOL_FILE = os.path.join(PROJECT_PATH, "api", "tips_pool.json")
 TIP_ENRICHMENT_FILE = os.path.join(PROJECT_PATH, "api", "tip_enrichments.json")
@@ -25,66 +61,549 @@ FRONT_END_TIP_KEYS = [
 ]
 
 
-tips_pool = []
-tip_enrichments = []
-compound_rules = []
+# the current RuleSet, see install_rule_set
+rule_set = None
+
+# positions of the pool tips which passed their rules, by result_cache_key, None when disabled
+result_cache = None
+if get_result_cache_size() > 0:
+    result_cache = create_result_cache(
+        get_result_cache_backend(),
+        get_result_cache_size(),
+        get_result_cache_ttl(),
+        get_result_cache_path(),
+    )
+
+
+class FrozenDict(dict):
+    """Read-only dict for tips which are shared between requests."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+def freeze(value, memo=None):
+    """
+    Make a read-only copy of a json value, lists become tuples. Values which are already
+    read-only are not copied. With a memo, equal values share one copy and strings are
+    interned, which keeps the tips content compact.
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        frozen = FrozenDict((key, freeze(item, memo)) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        frozen = tuple(freeze(item, memo) for item in value)
+    elif isinstance(value, str) and memo is not None:
+        return sys.intern(value)
+    else:
+        return value
+
+    if memo is None:
+        return frozen
+    # the encoding tells 1, 1.0 and true apart, which are equal in Python
+    return memo.setdefault(encode(frozen), frozen)
+
+
+class TipRecord(FrozenDict):
+    """Read-only frontend output of a pool tip, with its json encoding."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoded = encode(self)
+
+    def __reduce__(self):
+        # keep the encoding, so it is not encoded again when it is unpickled
+        return restore_tip_record, (dict(self), self.encoded)
+
+
+def restore_tip_record(items, encoded):
+    record = TipRecord.__new__(TipRecord)
+    dict.update(record, items)
+    record.encoded = encoded
+    return record
+
+
+def parse_active_date(value):
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class TipsIndex:
+    """
+    Inverted index of tips on (audience, isPersonalized, alwaysVisible).
+    Every tip is also indexed under the audience None, which is used when no audience is requested.
+
+    The active period of the tips is parsed once, the set of tips active on a day is only
+    recomputed when the day changes.
+
+    The source tips are not modified. They are normalized and enriched once into read-only
+    copies (tips), and projected to the read-only frontend output of each tip (records).
+    Records are encoded to json once as well, see json_encoder.
+    Both are stored in order of priority, highest first. Tips with the same priority keep
+    their order.
+
+    The rules of every tip are ordered so cheap and selective rules run first, on the rule
+    stats measured so far. Rebuilding the index picks up the latest measurements.
+
+    The index keeps the compound rules and their graph. Without rules the ones of the current
+    RuleSet are used.
+    """
+
+    def __init__(
+        self,
+        source,
+        version: str = "",
+        compound_rules=None,
+        compiled_rules=None,
+        enrichments_by_id=None,
+        rule_graph=None,
+        memo=None,
+    ):
+        if compound_rules is None:
+            compound_rules = rule_set.compound_rules
+        if compiled_rules is None:
+            compiled_rules = rule_set.compiled_rules
+        if enrichments_by_id is None:
+            enrichments_by_id = rule_set.enrichments_by_id
+        if rule_graph is None:
+            rule_graph = RuleGraph(compound_rules, compiled_rules)
+
+        self.source = source
+        # identifies the content the index was built from, see content_version
+        self.version = version
+        self.compound_rules = compound_rules
+        self.compiled_rules = compiled_rules
+        self.enrichments_by_id = enrichments_by_id
+        self.rule_graph = rule_graph
+        self.tips = []
+        self.records = []
+        self.index = {}
+        # position -> (dateActiveStart, dateActiveEnd) of all tips marked as active
+        self.active_periods = {}
+        self._active_on = (None, frozenset())
+
+        source_by_priority = sorted(source, key=lambda t: t["priority"], reverse=True)
+
+        for position, tip in enumerate(source_by_priority):
+            tip = dict(tip)
+            tip["reason"] = get_tip_reasons(tip, rule_graph)
+            if "rules" in tip:
+                tip["rules"] = order_rules(tip["rules"], compound_rules, compiled_rules)
+            normalize_tip_personalization(tip)
+            enrich_tip(tip, enrichments_by_id)
+            tip = freeze(tip, memo)
+            self.tips.append(tip)
+            self.records.append(TipRecord(normalize_tip_output(tip)))
+
+            if tip.get("active"):
+                self.active_periods[position] = (
+                    parse_active_date(tip.get("dateActiveStart")),
+                    parse_active_date(tip.get("dateActiveEnd")),
+                )
+
+            personalized = bool(tip["isPersonalized"])
+            always_visible = bool(tip.get("alwaysVisible", False))
+            for audience in [None, *set(tip.get("audience") or [])]:
+                key = (audience, personalized, always_visible)
+                self.index.setdefault(key, []).append(position)
+
+    def active_positions(self, today: date):
+        """Positions of the tips which are active on the given day."""
+        active_on, positions = self._active_on
+        if active_on != today:
+            positions = frozenset(
+                position
+                for position, (start, end) in self.active_periods.items()
+                if (start is None or start <= today) and (end is None or end >= today)
+            )
+            self._active_on = (today, positions)
+        return positions
+
+    def candidates(self, optin: bool, audience: List[str] = None, today: date = None):
+        """
+        Positions of the tips which match the audience and can be shown for the optin,
+        in order of priority.
+        When today is passed only the tips which are active on that day are returned.
+        """
+        positions = set()
+        for tip_audience in audience or [None]:
+            for key in (
+                (tip_audience, optin, False),
+                (tip_audience, False, True),
+                (tip_audience, True, True),
+            ):
+                positions.update(self.index.get(key, []))
+
+        if today is not None:
+            positions.intersection_update(self.active_positions(today))
+
+        return sorted(positions)
+
+
+def load_json(path):
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def content_version(pool, enrichments, compound):
+    """Digest of the tips pool, enrichments and compound rules, the same in every process."""
+    return hashlib.sha256(encode([pool, enrichments, compound])).hexdigest()
+
+
+def compile_content_rules(pool, compound):
+    """
+    Parse all rules up front so invalid rules fail at load time instead of being ignored per
+    request. Returns a map of rule string -> AST.
+    """
+    new_compiled_rules = {}
+    for tip in pool:
+        compile_rules(tip.get("rules", []), new_compiled_rules)
+    for compound_rule in compound.values():
+        compile_rules(compound_rule["rules"], new_compiled_rules)
+    return new_compiled_rules
+
+
+def index_tip_enrichments(enrichments):
+    """Map every tip id to its enrichment, only one enrichment per tip allowed."""
+    enrichments_by_id = {}
+    for enrichment in enrichments:
+        for tip_id in enrichment["for_ids"]:
+            enrichments_by_id.setdefault(tip_id, enrichment)
+    return enrichments_by_id
+
+
+class RuleSet:
+    """
+    Immutable snapshot of the tips content: the tips pool, enrichments and compound rules, with
+    everything derived from them. The content is frozen, see freeze.
+
+    A request takes the current rule set once and only uses that one, so a reload of the
+    content while the request runs can not mix versions. The version is a digest of the
+    content, see content_version. Installing an older rule set again is an instant swap.
+    """
+
+    __slots__ = (
+        "pool",
+        "enrichments",
+        "compound_rules",
+        "enrichments_by_id",
+        "compiled_rules",
+        "rule_graph",
+        "user_data_paths",
+        "version",
+        "index",
+    )
+
+    def __init__(self, pool, enrichments, compound_rules):
+        set_attribute = partial(object.__setattr__, self)
+        # equal values in the content and its index share one copy
+        memo = {}
+        set_attribute("version", content_version(pool, enrichments, compound_rules))
+        set_attribute("pool", freeze(pool, memo))
+        set_attribute("enrichments", freeze(enrichments, memo))
+        set_attribute("compound_rules", freeze(compound_rules, memo))
+        set_attribute(
+            "enrichments_by_id",
+            FrozenDict(index_tip_enrichments(self.enrichments)),
+        )
+        set_attribute(
+            "compiled_rules",
+            FrozenDict(compile_content_rules(self.pool, self.compound_rules)),
+        )
+        set_attribute(
+            "rule_graph",
+            RuleGraph(self.compound_rules, self.compiled_rules, self.pool),
+        )
+        set_attribute("user_data_paths", freeze(self.rule_graph.tips_paths(self.pool)))
+        set_attribute("index", self._build_index(memo))
+
+    def _build_index(self, memo=None):
+        return TipsIndex(
+            self.pool,
+            self.version,
+            compound_rules=self.compound_rules,
+            compiled_rules=self.compiled_rules,
+            enrichments_by_id=self.enrichments_by_id,
+            rule_graph=self.rule_graph,
+            memo=memo,
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    __delattr__ = __setattr__
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    def reindex(self):
+        """
+        A copy of the rule set with a new index, which orders the rules on the latest stats.
+        The content and the compiled rules are shared with this rule set.
+        """
+        copy = RuleSet.__new__(RuleSet)
+        copy.__setstate__(dict(self.__getstate__(), index=self._build_index()))
+        return copy
+
+
+def install_rule_set(new_rule_set):
+    """
+    Start using a rule set. The ASTs of its rules are put in the expression cache of objectpath,
+    which Tree.execute uses, these only depend on the rule string. The rule set itself is
+    swapped in last, at once.
+    """
+    global rule_set
+
+    previous = rule_set
+    EXPR_CACHE.update(new_rule_set.compiled_rules)
+    if get_rule_backend() == "native":
+        native_rules = compile_native_rules(new_rule_set.compiled_rules)
+        rule_engine.native_rules = {**rule_engine.native_rules, **native_rules}
+
+    rule_set = new_rule_set
+
+    # the results only change with the content, not with the order of the rules
+    if result_cache is not None and (
+        previous is None or previous.version != new_rule_set.version
+    ):
+        result_cache.invalidate()
+
+
+# names of the content of the current rule set which can be read from the module
+RULE_SET_ATTRIBUTES = {
+    "tips_pool": "pool",
+    "tip_enrichments": "enrichments",
+    "compound_rules": "compound_rules",
+    "tip_enrichments_by_id": "enrichments_by_id",
+    "compiled_rules": "compiled_rules",
+    "user_data_paths": "user_data_paths",
+    "tips_index": "index",
+}
+
+
+def __getattr__(name):
+    if name in RULE_SET_ATTRIBUTES and rule_set is not None:
+        return getattr(rule_set, RULE_SET_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def refresh_content(pool=None, enrichments=None, compound=None):
+    """
+    Build a new rule set of the content and install it, the content which is not given stays
+    the same. Requests which already use the previous rule set finish with it.
+    """
+    with refresh_lock:
+        current = rule_set
+        install_rule_set(
+            RuleSet(
+                current.pool if pool is None else pool,
+                current.enrichments if enrichments is None else enrichments,
+                current.compound_rules if compound is None else compound,
+            )
+        )
+
+
+def content_files():
+    return TIPS_POOL_FILE, TIP_ENRICHMENT_FILE, COMPOUND_RULES_FILE
+
+
+def load_rule_set(artifact_path=None):
+    """
+    The rule set of the content files, from the precompiled artifact when it was built from
+    the current files, otherwise from the json sources.
+    """
+    sources = read_sources(content_files())
+    if artifact_path is not None:
+        loaded = load_artifact(artifact_path, source_hashes(sources))
+        if isinstance(loaded, RuleSet):
+            return loaded
+    return RuleSet(*(json.loads(sources[path]) for path in content_files()))
+
+
+def build_rule_set_artifact(path):
+    """Build the rule set of the json sources and write it as precompiled artifact."""
+    sources = read_sources(content_files())
+    built = RuleSet(*(json.loads(sources[path]) for path in content_files()))
+    write_artifact(path, built, source_hashes(sources))
+    return built
+
+
+def reload_content():
+    """Read the tips pool, enrichments and compound rules files and install them."""
+    with refresh_lock:
+        install_rule_set(load_rule_set(get_rule_set_artifact_path()))
+
+
+def refresh_tips_index():
+    """Rebuild the index of the current content, picking up the latest rule stats."""
+    with refresh_lock:
+        install_rule_set(rule_set.reindex())
 
 
 def refresh_tips_pool():
-    global tips_pool
-    with open(TIPS_POOL_FILE) as fp:
-        tips_pool = json.load(fp)
-        fp.close()
+    refresh_content(pool=load_json(TIPS_POOL_FILE))
 
 
 def refresh_tip_enrichments():
-    global tip_enrichments
-    with open(TIP_ENRICHMENT_FILE) as fp:
-        tip_enrichments = json.load(fp)
-        fp.close()
+    refresh_content(enrichments=load_json(TIP_ENRICHMENT_FILE))
 
 
 def refresh_compound_rules():
-    global compound_rules
-    with open(COMPOUND_RULES_FILE) as fp:
-        compound_rules = json.load(fp)
-        fp.close()
+    refresh_content(compound=load_json(COMPOUND_RULES_FILE))
 
 
-def get_reasoning(tip):
-    reasons = []
-    reason = tip.get("reason")
-    if reason:
-        reasons.append(reason)
-    rules = tip.get("rules", [])
-    for rule in rules:
-        if rule["type"] == "ref":
-            reasons.extend(get_reasoning(compound_rules[rule["ref_id"]]))
+# only one refresh of the content at a time, requests do not take it
+refresh_lock = threading.RLock()
 
-    return reasons
 
+class ContentWatcher(threading.Thread):
+    """
+    Polls the modification times of the content files, and reloads the content in this thread
+    when one of them changes. When the new content fails to load, the current content is kept
+    until the files change again.
+    """
 
-refresh_tips_pool()
-refresh_tip_enrichments()
-refresh_compound_rules()
+    files = (TIPS_POOL_FILE, TIP_ENRICHMENT_FILE, COMPOUND_RULES_FILE)
+
+    def __init__(self, interval: float):
+        super().__init__(name="tips-content-watcher", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.mtimes = self.get_mtimes()
+
+    def get_mtimes(self):
+        try:
+            return tuple(os.stat(path).st_mtime_ns for path in self.files)
+        except OSError:
+            # a file is being replaced, try again next time
+            return None
+
+    def check(self):
+        """Reload the content when the files changed, returns True when it was reloaded."""
+        mtimes = self.get_mtimes()
+        if mtimes is None or mtimes == self.mtimes:
+            return False
+
+        self.mtimes = mtimes
+        try:
+            reload_content()
+        except Exception:
+            logging.exception("Failed to reload the tips content")
+            return False
+        logging.info("Reloaded the tips content, version %s", rule_set.version)
+        return True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_content_watcher(interval: float):
+    watcher = ContentWatcher(interval)
+    watcher.start()
+    return watcher
+
+
+# the fraction of the requests which measure their rule evaluations in rule_engine.rule_stats,
+# only set while a RuleReorderer uses the measurements
+rule_stats_sample_rate = 0.0
+
+
+def get_evaluation_context():
+    """The EvaluationContext of a request, which measures the rules for a sample of requests."""
+    if rule_stats_sample_rate and random.random() < rule_stats_sample_rate:
+        return EvaluationContext(rule_engine.rule_stats)
+    return EvaluationContext()
 
-for tip in tips_pool:
-    reason = tip.get("reason")
 
-    # if tip has a reason, only use that one.
+class RuleReorderer(threading.Thread):
+    """
+    Reindexes the current rule set every interval when rules were measured since the last time,
+    so the rules of the tips are ordered on their measured cost and pass rate, see order_rules.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="tips-rule-reorderer", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples = rule_engine.rule_stats.samples
+
+    def check(self):
+        """Reindex when there are new measurements, returns True when it reindexed."""
+        samples = rule_engine.rule_stats.samples
+        if samples == self.samples:
+            return False
+
+        self.samples = samples
+        try:
+            refresh_tips_index()
+        except Exception:
+            logging.exception("Failed to reorder the rules")
+            return False
+        return True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_rule_reorderer(interval: float, sample_rate: float):
+    """Measure a sample of the requests, and reorder the rules on them every interval."""
+    global rule_stats_sample_rate
+
+    rule_stats_sample_rate = sample_rate
+    reorderer = RuleReorderer(interval)
+    reorderer.start()
+    return reorderer
+
+
+def get_tip_reasons(tip, rule_graph):
+    """
+    If tip has a reason, only use that one. Otherwise the reasons are those of its compound
+    rules, see RuleGraph. Reasons which are already a list are used as they are.
+    """
+    reason = tip.get("reason")
+    if isinstance(reason, (list, tuple)):
+        return list(reason)
     if reason:
-        tip["reason"] = [reason]
-        continue
+        return [reason]
+    return rule_graph.rules_reasons(tip.get("rules", []))
+
 
-    # recursively built reasons
-    reasons = get_reasoning(tip)
-    tip["reason"] = reasons
+def get_empty_tree(context=None):
+    """The tree without user data, one per request, which is only created when it is used."""
+    if context is None:
+        return UserDataTree({})
+    if context.empty_tree is None:
+        context.empty_tree = UserDataTree({})
+    return context.empty_tree
 
 
-def tip_filter(tip, userdata_tree, optin: bool = False):
+def tip_filter(
+    tip, userdata_tree, optin: bool = False, context=None, compound_rules=None
+):
     """
     If tip has a field "rules", the result must be true for it to be included.
     If tip does not have "rules, it is included.
+    The active period of the tip (dateActiveStart/dateActiveEnd) is checked by the TipsIndex.
     """
 
     # Return early if basic conditions are not met
@@ -96,23 +615,18 @@ def tip_filter(tip, userdata_tree, optin: bool = False):
     if not tip["active"]:
         return False
 
-    today = date.today()
-
-    if tip.get("dateActiveStart"):
-        date_active_start = datetime.strptime(tip["dateActiveStart"], "%Y-%m-%d").date()
-        if date_active_start > today:
-            return False
-
-    if tip.get("dateActiveEnd"):
-        date_active_end = datetime.strptime(tip["dateActiveEnd"], "%Y-%m-%d").date()
-        if date_active_end < today:
-            return False
-
     # No need to process tips that don't have rules, we can safely show them
     if "rules" not in tip:
         return True
 
-    passed = apply_rules(userdata_tree, tip["rules"], compound_rules)
+    # There is no user data without optin, the rules are executed on an empty tree
+    if userdata_tree is None:
+        userdata_tree = get_empty_tree(context)
+
+    if compound_rules is None:
+        compound_rules = rule_set.compound_rules
+
+    passed = apply_rules(userdata_tree, tip["rules"], compound_rules, context)
 
     return passed
 
@@ -185,50 +699,299 @@ def apply_enrichment(tip, enrichment):
         tip[key] = value
 
 
-def enrich_tip(tip):
-    for enrichment in tip_enrichments:
-        if tip["id"] in enrichment["for_ids"]:
-            apply_enrichment(tip, enrichment)
-            break  # only one enrichment per tip allowed
+def enrich_tip(tip, enrichments_by_id=None):
+    if enrichments_by_id is None:
+        enrichments_by_id = rule_set.enrichments_by_id
+    enrichment = enrichments_by_id.get(tip["id"])
+    if enrichment is not None:
+        apply_enrichment(tip, enrichment)
 
 
-def tips_generator(request_data=None, tips=None, audience: List[str] = None):
-    """Generate tips."""
-    if request_data is None:
-        request_data = {}
+def prepare_source_tips(
+    source_tips, audience: List[str] = None, enrichments_by_id=None
+):
+    """Format and enrich the source tips of a request, ordered by priority."""
+    source_tips = format_source_tips(source_tips)
+    for tip in source_tips:
+        normalize_tip_personalization(tip)
+        enrich_tip(tip, enrichments_by_id)
 
-    if tips is None:
-        tips = tips_pool
+    if audience:
+        source_tips = [
+            tip
+            for tip in source_tips
+            if set(tip.get("audience", [])).intersection(set(audience))
+        ]
+
+    source_tips.sort(key=lambda t: t["priority"], reverse=True)
+
+    return source_tips
+
+
+def get_tips_request_data(request_data, paths=None):
+    """
+    Read the request body. When the paths the rules read are given, the user data is pruned to
+    those paths, without optin no user data is kept at all.
+    """
+    user_data = {}
+    source_tips = []
+    optin = False
+
+    if "userData" in request_data:
+        user_data = request_data["userData"]
+
+    if "tips" in request_data:
+        source_tips = request_data["tips"]
 
-    # add source tips
-    if request_data["source_tips"]:
-        tips = tips + format_source_tips(request_data["source_tips"])
+    if "optin" in request_data and type(request_data["optin"]) is bool:
+        optin = request_data["optin"]
 
-    tips = [normalize_tip_personalization(tip) for tip in tips]
+    if paths is not None:
+        user_data = prune(user_data, paths) if optin else {}
 
+    return {"optin": optin, "user_data": user_data, "source_tips": source_tips}
+
+
+def get_user_data_tree(request_data):
+    """The tree of the user data, None without optin."""
     if request_data["optin"]:
-        user_data_prepared = UserDataTree(request_data["user_data"])
+        return UserDataTree(request_data["user_data"])
+    return None
+
+
+def merge_tips(pool_tips, source_tips):
+    """
+    Merge two lists (or iterators) of tips ordered by priority. Merging is lazy, so rules are
+    only evaluated for as many tips as needed. Pool tips go first when the priority is the same.
+    """
+    return heapq.merge(
+        pool_tips, source_tips, key=lambda t: t["priority"], reverse=True
+    )
+
+
+def log_evaluation_context(context):
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(
+            "Compound rule cache: %d hits, %d misses, hit ratio %.2f",
+            context.hits,
+            context.misses,
+            context.hit_ratio(),
+        )
+
+
+def log_result_cache():
+    if result_cache is not None and logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(
+            "Result cache: %d hits, %d misses, hit ratio %.2f",
+            result_cache.hits,
+            result_cache.misses,
+            result_cache.hit_ratio(),
+        )
+
+
+def passed_pool_positions(
+    snapshot, positions, request_data, audience, today, user_data_tree, context
+):
+    """
+    Positions of the pool tips which pass their rules, from the result cache when it has them.
+    With the cache all candidates are evaluated, so the result can be used for any limit.
+    """
+    key = result_cache_key(
+        request_data, audience, today, snapshot.user_data_paths, snapshot.version
+    )
+    index = snapshot.index
+    passed = result_cache.get(key)
+    if passed is None:
+        passed = tuple(
+            position
+            for position in positions
+            if tip_filter(
+                index.tips[position],
+                user_data_tree,
+                request_data["optin"],
+                context,
+                index.compound_rules,
+            )
+        )
+        result_cache.set(key, passed)
+    log_result_cache()
+    return passed
+
+
+def tips_generator(
+    request_data=None,
+    tips=None,
+    audience: List[str] = None,
+    limit: int = None,
+    offset: int = 0,
+    snapshot: RuleSet = None,
+):
+    """
+    Generate tips, ordered by priority.
+    When a limit is given, rules are only evaluated until offset + limit tips have passed.
+    The result is the same as slicing the full list of tips with [offset:offset + limit].
+    Only the given snapshot of the rule set is used, by default the current rule set.
+    """
+    if request_data is None:
+        request_data = {}
+
+    if snapshot is None:
+        snapshot = rule_set
+
+    if tips is None:
+        tips = snapshot.pool
+
+    # the index is built at load time for the tips pool, other tips are indexed on the fly
+    index = snapshot.index
+    if tips is not snapshot.pool:
+        index = TipsIndex(
+            tips,
+            compound_rules=snapshot.compound_rules,
+            compiled_rules=snapshot.compiled_rules,
+            enrichments_by_id=snapshot.enrichments_by_id,
+            rule_graph=snapshot.rule_graph,
+        )
+    today = date.today()
+    positions = index.candidates(request_data["optin"], audience, today)
+
+    source_tips = prepare_source_tips(
+        request_data["source_tips"], audience, snapshot.enrichments_by_id
+    )
+    user_data_prepared = get_user_data_tree(request_data)
+    context = get_evaluation_context()
+
+    if result_cache is not None and index is snapshot.index:
+        positions = passed_pool_positions(
+            snapshot,
+            positions,
+            request_data,
+            audience,
+            today,
+            user_data_prepared,
+            context,
+        )
+        pool_tips = (index.records[position] for position in positions)
     else:
-        user_data_prepared = UserDataTree({})
+        # only references to the prepared records of the pool tips are selected
+        pool_tips = (
+            index.records[position]
+            for position in positions
+            if tip_filter(
+                index.tips[position],
+                user_data_prepared,
+                request_data["optin"],
+                context,
+                index.compound_rules,
+            )
+        )
+
+    passed_source_tips = (
+        normalize_tip_output(tip)
+        for tip in source_tips
+        if tip_filter(
+            tip,
+            user_data_prepared,
+            request_data["optin"],
+            context,
+            snapshot.compound_rules,
+        )
+    )
+
+    tips = merge_tips(pool_tips, passed_source_tips)
+    stop = None if limit is None else offset + limit
+    tips = list(islice(tips, offset, stop))
+
+    log_evaluation_context(context)
 
-    for tip in tips:
-        enrich_tip(tip)
+    return tips
 
-    if audience:
-        tips = [
-            tip
-            for tip in tips
-            if set(tip.get("audience", [])).intersection(set(audience))
-        ]
 
-    tips = [
-        tip
-        for tip in tips
-        if tip_filter(tip, user_data_prepared, request_data["optin"])
+def tips_batch_generator(
+    requests_data, audience: List[str] = None, snapshot: RuleSet = None
+):
+    """
+    Generate tips for many requests at once, the result for each request is the same as
+    tips_generator would give. Pool tips are evaluated tip by tip for all requests, so the
+    setup per tip and its rules is shared by the whole batch.
+    """
+    if snapshot is None:
+        snapshot = rule_set
+    index = snapshot.index
+    today = date.today()
+
+    source_tips = [
+        prepare_source_tips(
+            request_data["source_tips"], audience, snapshot.enrichments_by_id
+        )
+        for request_data in requests_data
     ]
+    user_data_trees = [
+        get_user_data_tree(request_data) for request_data in requests_data
+    ]
+    contexts = [get_evaluation_context() for _ in requests_data]
+    pool_tips = [[] for _ in requests_data]
+
+    for optin in (False, True):
+        members = [
+            member
+            for member, request_data in enumerate(requests_data)
+            if request_data["optin"] == optin
+        ]
+        if not members:
+            continue
+
+        for position in index.candidates(optin, audience, today):
+            tip = index.tips[position]
+            for member in members:
+                if tip_filter(
+                    tip,
+                    user_data_trees[member],
+                    optin,
+                    contexts[member],
+                    index.compound_rules,
+                ):
+                    pool_tips[member].append(index.records[position])
+
+    results = []
+    for member, request_data in enumerate(requests_data):
+        passed_source_tips = [
+            normalize_tip_output(tip)
+            for tip in source_tips[member]
+            if tip_filter(
+                tip,
+                user_data_trees[member],
+                request_data["optin"],
+                contexts[member],
+                snapshot.compound_rules,
+            )
+        ]
+        results.append(list(merge_tips(pool_tips[member], passed_source_tips)))
+        log_evaluation_context(contexts[member])
 
-    tips = [normalize_tip_output(tip) for tip in tips]
+    return results
 
-    tips.sort(key=lambda t: t["priority"], reverse=True)
 
-    return tips
+def _tips_generator_worker(body, audience: List[str] = None):
+    snapshot = rule_set
+    request_data = get_tips_request_data(body, snapshot.user_data_paths)
+    return tips_generator(request_data, audience=audience, snapshot=snapshot)
+
+
+def parallel_tips_generator(
+    bodies,
+    audience: List[str] = None,
+    processes: int = None,
+    chunksize: int = 16,
+):
+    """
+    Generate tips for an iterable of request bodies in a pool of worker processes, for offline
+    jobs. A body is the decoded json body of /tips/gettips, the workers process it like the
+    endpoint does. Results are yielded in the order of the bodies as soon as they are available.
+    The workers are forked, so they inherit the rule set already loaded in this process.
+    """
+    worker = partial(_tips_generator_worker, audience=audience)
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        yield from pool.imap(worker, bodies, chunksize)
+
+
+reload_content()
@@ -1,14 +1,20 @@
 import datetime
+from collections.abc import Mapping
 import objectpath
 import pytz
 from dateutil import parser
+from objectpath.core.interpreter import EXPR_CACHE
+from objectpath.core.parser import parse
 from objectpath.utils import timeutils
 
+from tips.generator.rule_engine import NOW_FUNCTION, pin_now
+
 
 # taken concept from https://stackoverflow.com/a/9388462/756075
-def yearsAgo(datestring):
+def yearsAgo(datestring, today=None):
     subject_date = parser.isoparse(datestring)
-    today = datetime.date.today()
+    if today is None:
+        today = datetime.date.today()
     years = today.year - subject_date.year
     if (
         today.month < subject_date.month
@@ -31,12 +37,89 @@ def strToUtcDateTime(datestring):
     return dt
 
 
+class TreeFunctions(Mapping):
+    """
+    The functions objectpath can call from the rules of one tree. The table of functions is
+    built once per process (FUNCTIONS), the functions of a tree are bound on lookup.
+    """
+
+    __slots__ = ("tree",)
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __getitem__(self, name):
+        method = FUNCTIONS.get(name)
+        if method is None:
+            return objectpath.Tree._REGISTERED_FUNCTIONS[name]
+        return method.__get__(self.tree)
+
+    def __contains__(self, name):
+        return name in FUNCTIONS or name in objectpath.Tree._REGISTERED_FUNCTIONS
+
+    def __iter__(self):
+        yield from FUNCTIONS
+        yield from objectpath.Tree._REGISTERED_FUNCTIONS
+
+    def __len__(self):
+        return len(FUNCTIONS) + len(objectpath.Tree._REGISTERED_FUNCTIONS)
+
+
 class UserDataTree(objectpath.Tree):
+    """
+    The data of one user, which the rules of a single request are executed on.
+
+    Creating a tree is cheap: it only binds the data, the function table is shared by all
+    trees. Today and now are fixed the first time a rule uses them, so all rules of the
+    request see the same instant. now() in the rules calls the now of the tree, see pin_now. The date
+    functions are memoized for the lifetime of the tree, a date which is used by many rules
+    is parsed only once.
+    """
+
     def __init__(self, obj, cfg=None):
         super().__init__(obj, cfg)
-        self.register_function("yearsAgo", yearsAgo)
-        self.register_function("today", lambda: datetime.date.today())
-        self.register_function(
-            "strToUtcDateTime",
-            strToUtcDateTime,
-        )
+
+        self._today = None
+        self._now = None
+        # (function name, datestring) -> result
+        self._dates = {}
+        # objectpath looks the functions up on the tree
+        self._REGISTERED_FUNCTIONS = TreeFunctions(self)
+
+    def compile(self, expr):
+        """The AST of a rule, rules which are not precompiled are compiled like compile_rule."""
+        ast = EXPR_CACHE.get(expr)
+        if ast is None:
+            ast = EXPR_CACHE[expr] = pin_now(parse(expr, self.D))
+        return ast
+
+    def today(self):
+        if self._today is None:
+            self._today = datetime.date.today()
+        return self._today
+
+    def now(self):
+        if self._now is None:
+            self._now = timeutils.now()
+        return self._now
+
+    def years_ago(self, datestring):
+        key = ("yearsAgo", datestring)
+        if key not in self._dates:
+            self._dates[key] = yearsAgo(datestring, self.today())
+        return self._dates[key]
+
+    def str_to_utc_date_time(self, datestring):
+        key = ("strToUtcDateTime", datestring)
+        if key not in self._dates:
+            self._dates[key] = strToUtcDateTime(datestring)
+        return self._dates[key]
+
+
+# function name in the rules -> method of UserDataTree
+FUNCTIONS = {
+    "yearsAgo": UserDataTree.years_ago,
+    "today": UserDataTree.today,
+    NOW_FUNCTION: UserDataTree.now,
+    "strToUtcDateTime": UserDataTree.str_to_utc_date_time,
+}
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
 
@@ -9,3 +10,76 @@ def get_sentry_dsn():
 
 def get_photo_path():
     return os.path.join(PROJECT_PATH, "static", "tip_images")
+
+
+def get_rule_backend():
+    """Either "objectpath" (the interpreter) or "native" (rules compiled to Python closures)."""
+    return os.getenv("TIPS_RULE_BACKEND", "objectpath")
+
+
+def get_result_cache_size():
+    """The number of results the result cache keeps, 0 (the default) disables the cache."""
+    return int(os.getenv("TIPS_RESULT_CACHE_SIZE", "0"))
+
+
+def get_result_cache_ttl():
+    """Seconds a result is kept in the result cache."""
+    return float(os.getenv("TIPS_RESULT_CACHE_TTL", "300"))
+
+
+def get_result_cache_backend():
+    """
+    Either "memory" (in process) or "sqlite" (a local file, shared by the worker processes).
+    """
+    return os.getenv("TIPS_RESULT_CACHE_BACKEND", "memory")
+
+
+def get_result_cache_path():
+    """
+    The file of the sqlite result cache. Its directory must only be writable by the user the
+    app runs as, by default a directory per user in the temp directory is created for it.
+    """
+    return os.getenv(
+        "TIPS_RESULT_CACHE_PATH",
+        os.path.join(
+            tempfile.gettempdir(),
+            f"tips-result-cache-{os.getuid()}",
+            "results.sqlite3",
+        ),
+    )
+
+
+def get_reload_interval():
+    """
+    Seconds between checks for changes of the tips pool, enrichments and compound rules files.
+    Changed files are reloaded without a restart. 0 disables reloading.
+    """
+    return float(os.getenv("TIPS_RELOAD_INTERVAL", 0))
+
+
+def get_rule_set_artifact_path():
+    """The precompiled rule set, see rule_set_artifact. Ignored when it does not exist."""
+    return os.getenv(
+        "TIPS_RULE_SET_ARTIFACT", os.path.join(PROJECT_PATH, "api", "rule_set.pickle")
+    )
+
+
+def get_rule_reorder_interval():
+    """
+    Seconds between reorderings of the rules on their measured cost and pass rate. 0 disables
+    measuring and reordering, the rules are then ordered on their static cost.
+    """
+    return float(os.getenv("TIPS_RULE_REORDER_INTERVAL", 300))
+
+
+def get_rule_stats_sample_rate():
+    """The fraction of the requests which measure their rule evaluations."""
+    return float(os.getenv("TIPS_RULE_STATS_SAMPLE_RATE", 0.01))
+
+
+def get_gc_freeze():
+    """
+    Freeze the objects the uWSGI master loads before it forks the workers, see tips.preload.
+    Off by default, it did not reduce the memory of the workers of this app in measurements.
+    """
+    return os.getenv("TIPS_GC_FREEZE", "0") == "1"
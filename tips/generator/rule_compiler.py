@@ -0,0 +1,338 @@
+"""
+Compiles the subset of ObjectPath used by our rules into plain Python closures.
+
+The closures follow the semantics of the objectpath interpreter (Tree.execute), including its
+quirks, so a compiled rule gives the same result as executing the rule on a UserDataTree.
+Anything outside the supported subset raises UnsupportedRule, those rules are executed by
+the objectpath interpreter instead.
+"""
+
+from objectpath.core import ITER_TYPES, NUM_TYPES, SELECTOR_OPS, STR_TYPES, chain
+from objectpath.core import generator
+from objectpath.utils import skip, timeutils
+
+from tips.generator.rule_engine import NOW_FUNCTION
+
+# same as the objectpath interpreter, used in float comparison
+EPSILON = 0.0000000000000001
+
+# builtin objectpath functions, the other supported functions are registered on the tree
+BUILTIN_FUNCTIONS = {"len", "count", "now", "dateTime"}
+REGISTERED_FUNCTIONS = {"yearsAgo", "strToUtcDateTime", "today", NOW_FUNCTION}
+
+COMPARISONS = {
+    ">": lambda fst, snd: fst > snd,
+    "<": lambda fst, snd: fst < snd,
+    ">=": lambda fst, snd: fst >= snd,
+    "<=": lambda fst, snd: fst <= snd,
+}
+
+
+class UnsupportedRule(Exception):
+    pass
+
+
+def compile_native(ast):
+    """
+    Compile an objectpath AST into a function taking the UserDataTree to evaluate it on.
+    Raises UnsupportedRule when the AST uses something the compiler does not support.
+    """
+    compiled = _compile(ast)
+
+    def evaluate(tree):
+        return compiled(tree, None)
+
+    return evaluate
+
+
+def compile_native_rules(compiled_rules):
+    """Compile a map of rule string -> AST, rules which are not supported are left out."""
+    native_rules = {}
+    for rule, ast in compiled_rules.items():
+        try:
+            native_rules[rule] = compile_native(ast)
+        except UnsupportedRule:
+            pass
+    return native_rules
+
+
+def _reexecute(value):
+    """The interpreter executes evaluated operands again, which turns lists into generators."""
+    if type(value) is list:
+        return (_reexecute(item) for item in value)
+    if type(value) is dict:
+        return {_reexecute(key): _reexecute(item) for key, item in value.items()}
+    return value
+
+
+def is_(fst, snd, negate=False):
+    """The objectpath "is" and "is not" operators."""
+    if not negate and fst == snd:
+        return True
+
+    typefst = type(fst)
+    typesnd = type(snd)
+    ret = None
+    if typefst in STR_TYPES:
+        ret = fst == str(snd)
+    elif typefst is float or typesnd is float:
+        ret = abs(float(fst) - float(snd)) < EPSILON
+    elif typefst is int or typesnd is int:
+        ret = int(fst) == int(snd)
+    elif typefst is list and typesnd is list:
+        ret = fst == snd
+    elif typefst is dict and typesnd is dict:
+        ret = fst == snd
+
+    if negate:
+        if ret is None:
+            return False
+        return not ret
+    return ret
+
+
+def in_(fst, snd, negate=False):
+    """The objectpath "in" and "not in" operators."""
+    if type(fst) in ITER_TYPES and type(snd) in ITER_TYPES:
+        found = any(x in max(fst, snd, key=len) for x in min(fst, snd, key=len))
+    else:
+        found = fst in snd
+    return not found if negate else found
+
+
+def get_attribute(fst, name):
+    """The objectpath "." operator with a name on the right."""
+    if type(fst) in ITER_TYPES:
+        return (e[name] for e in fst if type(e) is dict and name in e)
+    try:
+        return fst.get(name)
+    except Exception:
+        try:
+            return fst.__getattribute__(name)
+        except AttributeError:
+            return fst
+
+
+def get_item(fst, snd):
+    """The objectpath "[" operator with an index or key."""
+    typefst = type(fst)
+    if typefst in [tuple] + ITER_TYPES + STR_TYPES:
+        typesnd = type(snd)
+        if typesnd in NUM_TYPES or typesnd is str and snd.isdigit():
+            n = int(snd)
+            if typefst in (generator, chain):
+                if n > 0:
+                    return skip(fst, n)
+                elif n == 0:
+                    return next(fst)
+                fst = list(fst)
+            try:
+                return fst[n]
+            except (IndexError, TypeError):
+                return None
+        if type(snd) in STR_TYPES:
+            return get_attribute(fst, snd)
+        return snd
+    try:
+        return fst[snd]
+    except KeyError:
+        return []
+
+
+def length(value):
+    """The objectpath len() and count() functions."""
+    if value in (True, False, None):
+        return value
+    if type(value) in ITER_TYPES:
+        return len(list(value))
+    return len(value)
+
+
+def _constant(value):
+    return lambda tree, current: value
+
+
+def _compile(node):
+    if node is None or type(node) in (str, int, float, bool):
+        return _constant(node)
+
+    if type(node) is not tuple or not node:
+        raise UnsupportedRule(f"Unsupported node: {node!r}")
+
+    op = node[0]
+
+    if op == "(root)":
+        return lambda tree, current: tree.data
+
+    if op == "(current)":
+        return lambda tree, current: current
+
+    if op == "name":
+        return _constant(node[1])
+
+    if op in ("and", "or"):
+        fst = _compile(node[1])
+        snd = _compile(node[2])
+        if op == "and":
+            return lambda tree, current: fst(tree, current) and snd(tree, current)
+        return lambda tree, current: fst(tree, current) or snd(tree, current)
+
+    if op == "not":
+        fst = _compile(node[1])
+        return lambda tree, current: not fst(tree, current)
+
+    if op in ("is", "is not"):
+        negate = op == "is not"
+        fst = _compile(node[1])
+        snd = _compile(node[2])
+        return lambda tree, current: is_(fst(tree, current), snd(tree, current), negate)
+
+    if op in ("in", "not in"):
+        negate = op == "not in"
+        fst = _compile(node[1])
+        snd = _compile(node[2])
+        return lambda tree, current: in_(fst(tree, current), snd(tree, current), negate)
+
+    if op in COMPARISONS:
+        compare = COMPARISONS[op]
+        fst = _compile(node[1])
+        snd = _compile(node[2])
+        return lambda tree, current: compare(fst(tree, current), snd(tree, current))
+
+    if op == ".":
+        return _compile_attribute(node)
+
+    if op == "[":
+        return _compile_item(node)
+
+    if op == "fn":
+        return _compile_function(node)
+
+    raise UnsupportedRule(f"Unsupported operator: {op}")
+
+
+def _compile_attribute(node):
+    if type(node[1]) is tuple:
+        fst = _compile(node[1])
+    else:
+        fst = _constant(node[1])
+
+    name_node = node[2]
+    if type(name_node) is tuple and name_node[0] == "*":
+        return fst
+
+    if type(name_node) is not tuple or name_node[0] != "name":
+        raise UnsupportedRule(f"Unsupported attribute: {name_node!r}")
+
+    name = name_node[1]
+    return lambda tree, current: get_attribute(fst(tree, current), name)
+
+
+def _compile_item(node):
+    if len(node) == 2:
+        # list literal
+        items = [_compile(item) for item in node[1]]
+        return lambda tree, current: [item(tree, current) for item in items]
+
+    if len(node) != 3:
+        raise UnsupportedRule(f"Unsupported use of [: {node!r}")
+
+    fst = _compile(node[1])
+    selector = node[2]
+
+    if type(selector) is tuple and selector[0] in SELECTOR_OPS:
+        return _compile_selector(fst, selector)
+
+    if type(selector) is tuple and selector[0] in ("(current)", "["):
+        raise UnsupportedRule(f"Unsupported selector: {selector!r}")
+
+    snd = _compile(selector)
+
+    def evaluate(tree, current):
+        value = fst(tree, current)
+        if not value:
+            return value
+        return get_item(value, snd(tree, value))
+
+    return evaluate
+
+
+def _compile_selector(fst, selector):
+    op = selector[0]
+    if op in ("fn", ":"):
+        raise UnsupportedRule(f"Unsupported selector: {selector!r}")
+
+    left = selector[1]
+    if type(left) is tuple and left[0] == "name":
+        left = left[1]
+    left = _compile(left)
+    right = _compile(selector[2])
+
+    if op in ("and", "or"):
+        # the interpreter evaluates both sides before combining them
+        def test(left_value, right_value):
+            if op == "and":
+                return left_value and right_value
+            return left_value or right_value
+
+    elif op in ("is", "is not"):
+        negate = op == "is not"
+
+        def test(left_value, right_value):
+            return is_(left_value, right_value, negate)
+
+    elif op in ("in", "not in"):
+        negate = op == "not in"
+
+        def test(left_value, right_value):
+            return in_(left_value, right_value, negate)
+
+    else:
+        test = COMPARISONS[op]
+
+    def select(tree, items):
+        for item in items:
+            try:
+                left_value = _reexecute(left(tree, item))
+                right_value = _reexecute(right(tree, item))
+                if test(left_value, right_value):
+                    yield item
+            except Exception:
+                pass
+
+    def evaluate(tree, current):
+        items = fst(tree, current)
+        if not items:
+            return items
+        if type(items) is dict:
+            items = [items]
+        return select(tree, items)
+
+    return evaluate
+
+
+def _compile_function(node):
+    name = node[1]
+    if name not in BUILTIN_FUNCTIONS and name not in REGISTERED_FUNCTIONS:
+        raise UnsupportedRule(f"Unsupported function: {name}")
+
+    args = [_compile(arg) for arg in node[2:]]
+
+    if name in ("len", "count"):
+        arg = args[0]
+        return lambda tree, current: length(arg(tree, current))
+
+    if name in ("now", NOW_FUNCTION):
+        # the instant of the request, fixed on the UserDataTree
+        return lambda tree, current: tree.now()
+
+    if name == "dateTime":
+        return lambda tree, current: timeutils.dateTime(
+            [arg(tree, current) for arg in args]
+        )
+
+    def call(tree, current):
+        function = tree._REGISTERED_FUNCTIONS[name]
+        return function(*[arg(tree, current) for arg in args])
+
+    return call
@@ -1,28 +1,262 @@
 import logging
+from time import perf_counter
+from tokenize import TokenError
 
 from objectpath import ExecutionError
-from objectpath.core import generator
+from objectpath.core import SELECTOR_OPS, generator
+from objectpath.core.parser import parse
 
+# the errors the objectpath parser raises on invalid rules
+PARSE_ERRORS = (SyntaxError, TokenError, StopIteration)
 
-def apply_rules(userdata, rules, compound_rules):
-    """returns True when it matches the rules."""
-    return all([_apply_rule(userdata, r, compound_rules) for r in rules])
 
+class RuleCompileError(Exception):
+    pass
 
-def _apply_rule(userdata, rule, compound_rules):
+
+# rule string -> native Python function, filled when the native rule backend is used
+native_rules = {}
+
+# the number of evaluations of a rule before its measured cost and pass rate are used
+MIN_SAMPLES = 20
+
+# relative cost of the parts of a rule, used to order rules which are not measured yet
+FUNCTION_COST = 5
+SELECTOR_FACTOR = 10
+
+
+# the function now() in the rules is compiled to, objectpath resolves its builtin now before
+# the functions of the tree, the tree gives all rules of a request the same instant
+NOW_FUNCTION = "requestNow"
+
+
+def pin_now(ast):
+    """The AST with the calls of now() replaced by calls of NOW_FUNCTION."""
+    if type(ast) is tuple:
+        if ast == ("fn", "now"):
+            return ("fn", NOW_FUNCTION)
+        return tuple(pin_now(node) for node in ast)
+    if type(ast) is list:
+        return [pin_now(node) for node in ast]
+    return ast
+
+
+def compile_rule(rule: str):
+    """Parse an ObjectPath rule into its AST. Raises RuleCompileError on invalid rules."""
+    try:
+        return pin_now(parse(rule))
+    except PARSE_ERRORS as error:
+        raise RuleCompileError(f"Rule failed to compile: {rule}") from error
+
+
+def compile_rules(rules, compiled_rules=None):
+    """Add the AST of every rule of type "rule" to compiled_rules, keyed by rule string."""
+    if compiled_rules is None:
+        compiled_rules = {}
+
+    for rule in rules:
+        if rule["type"] == "rule" and rule["rule"] not in compiled_rules:
+            compiled_rules[rule["rule"]] = compile_rule(rule["rule"])
+
+    return compiled_rules
+
+
+class EvaluationContext:
+    """
+    Per request state for evaluating rules against the data of a single user. With stats the
+    time and result of every rule evaluation is recorded in them, see RuleStats.
+    """
+
+    def __init__(self, stats=None):
+        # ref_id -> result of the compound rule for this user
+        self.ref_results = {}
+        self.stats = stats
+        # the tree the rules are executed on without optin, created when a rule needs it
+        self.empty_tree = None
+        self.hits = 0
+        self.misses = 0
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / lookups
+
+
+class RuleStats:
+    """
+    Evaluation counters per rule: the number of calls and passes and the total time spent.
+    Rules are keyed by (type, rule string or ref_id). Counters are shared by all requests, so
+    they are approximate when requests run in parallel threads.
+    Only the requests with these stats in their EvaluationContext are measured.
+    """
+
+    def __init__(self):
+        # key -> [calls, passes, seconds]
+        self.counters = {}
+        # the number of evaluations recorded, to tell whether there are new measurements
+        self.samples = 0
+
+    def record(self, key, seconds, passed):
+        self.samples += 1
+        counters = self.counters.get(key)
+        if counters is None:
+            counters = self.counters[key] = [0, 0, 0.0]
+        counters[0] += 1
+        counters[1] += bool(passed)
+        counters[2] += seconds
+
+    def measured(self, key):
+        counters = self.counters.get(key)
+        return counters is not None and counters[0] >= MIN_SAMPLES
+
+    def cost(self, key):
+        """Average seconds per evaluation."""
+        calls, passes, seconds = self.counters[key]
+        return seconds / calls
+
+    def pass_rate(self, key):
+        calls, passes, seconds = self.counters[key]
+        return passes / calls
+
+
+rule_stats = RuleStats()
+
+
+def rule_key(rule):
+    if rule["type"] == "ref":
+        return ("ref", rule["ref_id"])
+    return (rule["type"], rule.get("rule"))
+
+
+def estimate_cost(ast):
+    """Static cost of a rule AST: the number of nodes, with function calls and selectors weighted."""
+    if type(ast) is list:
+        return sum(estimate_cost(node) for node in ast)
+    if type(ast) is not tuple or not ast:
+        return 1
+
+    cost = 1 + sum(estimate_cost(node) for node in ast[1:])
+    if ast[0] == "fn":
+        cost += FUNCTION_COST
+    elif (
+        ast[0] == "["
+        and len(ast) == 3
+        and type(ast[2]) is tuple
+        and ast[2]
+        and ast[2][0] in SELECTOR_OPS
+    ):
+        cost *= SELECTOR_FACTOR
+    return cost
+
+
+def estimate_rule_cost(rule, compound_rules, compiled_rules, seen=None):
+    """Static cost of a rule, a compound rule costs as much as all of its rules."""
+    if rule["type"] == "rule":
+        ast = compiled_rules.get(rule["rule"])
+        if ast is None:
+            ast = compile_rule(rule["rule"])
+        return estimate_cost(ast)
+
+    if rule["type"] == "ref":
+        seen = set() if seen is None else seen
+        compound_rule = compound_rules.get(rule["ref_id"])
+        if compound_rule is None or rule["ref_id"] in seen:
+            return 1
+        seen.add(rule["ref_id"])
+        return sum(
+            estimate_rule_cost(r, compound_rules, compiled_rules, seen)
+            for r in compound_rule["rules"]
+        )
+    return 1
+
+
+def order_rules(rules, compound_rules, compiled_rules=None, stats=None):
+    """
+    Order rules so the cheapest rules which are most likely to fail run first, which is the
+    order with the lowest expected cost when apply_rules stops at the first failing rule:
+    ascending on cost / (1 - pass rate).
+    The measured cost and pass rate are used when all rules are measured often enough, otherwise
+    rules are ordered on their static cost. Rules with the same cost keep their order.
+    """
+    if compiled_rules is None:
+        compiled_rules = {}
+    if stats is None:
+        stats = rule_stats
+
+    keys = [rule_key(rule) for rule in rules]
+    if keys and all(stats.measured(key) for key in keys):
+
+        def expected_cost(index):
+            pass_rate = stats.pass_rate(keys[index])
+            if pass_rate == 1:
+                return float("inf")
+            return stats.cost(keys[index]) / (1 - pass_rate)
+
+    else:
+
+        def expected_cost(index):
+            return estimate_rule_cost(rules[index], compound_rules, compiled_rules)
+
+    order = sorted(range(len(rules)), key=expected_cost)
+    return [rules[index] for index in order]
+
+
+def apply_rules(userdata, rules, compound_rules, context=None):
+    """returns True when it matches the rules, stops at the first rule which fails."""
+    return all(_apply_rule(userdata, r, compound_rules, context) for r in rules)
+
+
+def _apply_compound_rule(userdata, ref_id, compound_rules, context=None):
+    if context is None:
+        return apply_rules(userdata, compound_rules[ref_id]["rules"], compound_rules)
+
+    if ref_id in context.ref_results:
+        context.hits += 1
+        return context.ref_results[ref_id]
+
+    context.misses += 1
+    rules = compound_rules[ref_id]["rules"]
+    if context.stats is None:
+        result = apply_rules(userdata, rules, compound_rules, context)
+    else:
+        start = perf_counter()
+        result = apply_rules(userdata, rules, compound_rules, context)
+        context.stats.record(("ref", ref_id), perf_counter() - start, result)
+    context.ref_results[ref_id] = result
+    return result
+
+
+_MISSING = object()
+
+
+def _execute_rule(userdata, rule):
+    try:
+        native_rule = native_rules.get(rule)
+        if native_rule is None:
+            result = userdata.execute(rule)
+        else:
+            result = native_rule(userdata)
+        if type(result) is generator:
+            # rules are only used as a condition, stop at the first match
+            return next(result, _MISSING) is not _MISSING
+        return result
+    except ExecutionError:
+        return False
+    except TypeError:
+        logging.error(f"Rule failed: {rule}")
+        return False
+
+
+def _apply_rule(userdata, rule, compound_rules, context=None):
     if rule["type"] == "rule":
-        try:
-            result = userdata.execute(rule["rule"])
-            if type(result) == generator:
-                return list(result)
-            return result
-        except ExecutionError:
-            return False
-        except TypeError:
-            logging.error(f"Rule failed: {rule['rule']}")
-            return False
+        if context is None or context.stats is None:
+            return _execute_rule(userdata, rule["rule"])
+        start = perf_counter()
+        result = _execute_rule(userdata, rule["rule"])
+        context.stats.record(("rule", rule["rule"]), perf_counter() - start, result)
+        return result
 
     if rule["type"] == "ref":
-        compound_rule = compound_rules[rule["ref_id"]]
-        return apply_rules(userdata, compound_rule["rules"], compound_rules)
+        return _apply_compound_rule(userdata, rule["ref_id"], compound_rules, context)
     return False
@@ -0,0 +1,141 @@
+"""
+The graph of the compound rules, the edges are the "ref" rules which refer to other compound
+rules. It is built once when the rules are loaded, and gives for every compound rule the
+compound rules and paths in the user data it reads transitively, and its reasons.
+"""
+
+from tips.generator.rule_engine import compile_rule
+from tips.generator.rule_paths import merge_paths, rule_paths
+
+
+class RuleGraphError(Exception):
+    pass
+
+
+def rule_refs(rules):
+    """The ref_ids of the ref rules, in order."""
+    return tuple(rule["ref_id"] for rule in rules if rule["type"] == "ref")
+
+
+class RuleGraph:
+    """
+    Directed acyclic graph of the compound rules. Raises RuleGraphError when a rule refers to
+    an unknown compound rule or when the references form a cycle.
+
+    Compound rules are processed in topological order, every rule after the rules it refers to,
+    so what a rule reads transitively is built once from the rules it refers to.
+    """
+
+    def __init__(self, compound_rules, compiled_rules=None, tips=()):
+        self.compound_rules = compound_rules
+        self.compiled_rules = {} if compiled_rules is None else compiled_rules
+
+        # ref_id -> ref_ids of the compound rules it refers to directly
+        self.dependencies = {}
+        for ref_id, compound_rule in compound_rules.items():
+            refs = rule_refs(compound_rule["rules"])
+            for ref in refs:
+                if ref not in compound_rules:
+                    raise RuleGraphError(
+                        f"Compound rule {ref_id} refers to unknown rule {ref}"
+                    )
+            self.dependencies[ref_id] = refs
+
+        self.order = self._topological_order()
+
+        # ref_id -> all compound rules it refers to, directly or through other rules
+        self.refs = {}
+        # ref_id -> the reasons of the rule and of the rules it refers to, depth first
+        self.reasons = {}
+        # ref_id -> the paths in the user data read by the rule and the rules it refers to
+        self.paths = {}
+        for ref_id in self.order:
+            compound_rule = compound_rules[ref_id]
+            refs = set()
+            for ref in self.dependencies[ref_id]:
+                refs.add(ref)
+                refs.update(self.refs[ref])
+            self.refs[ref_id] = frozenset(refs)
+
+            reasons = [compound_rule["reason"]] if compound_rule.get("reason") else []
+            reasons.extend(self.rules_reasons(compound_rule["rules"]))
+            self.reasons[ref_id] = tuple(reasons)
+
+            self.paths[ref_id] = frozenset(self._rules_paths(compound_rule["rules"]))
+
+        # ref_id -> ids of the tips which refer to it, directly or through other rules
+        self.dependent_tips = {ref_id: [] for ref_id in compound_rules}
+        for tip in tips:
+            for ref_id in self.tip_refs(tip):
+                self.dependent_tips[ref_id].append(tip["id"])
+
+    def _topological_order(self):
+        order = []
+        # ref_id -> True while its dependencies are visited, False when it is done
+        visiting = {}
+
+        def visit(ref_id, chain):
+            state = visiting.get(ref_id)
+            if state is False:
+                return
+            if state is True:
+                cycle = chain[chain.index(ref_id) :] + [ref_id]
+                raise RuleGraphError(
+                    "Compound rules refer to each other: " + " -> ".join(cycle)
+                )
+            visiting[ref_id] = True
+            for ref in self.dependencies[ref_id]:
+                visit(ref, chain + [ref_id])
+            visiting[ref_id] = False
+            order.append(ref_id)
+
+        for ref_id in self.dependencies:
+            visit(ref_id, [])
+        return tuple(order)
+
+    def _rule_ast(self, rule):
+        ast = self.compiled_rules.get(rule)
+        if ast is None:
+            ast = compile_rule(rule)
+        return ast
+
+    def _rules_paths(self, rules):
+        paths = set()
+        for rule in rules:
+            if rule["type"] == "rule":
+                paths.update(rule_paths(self._rule_ast(rule["rule"])))
+            elif rule["type"] == "ref":
+                paths.update(self.paths[rule["ref_id"]])
+        return paths
+
+    def rules_reasons(self, rules):
+        """The reasons of the compound rules the ref rules refer to, in order."""
+        reasons = []
+        for ref_id in rule_refs(rules):
+            reasons.extend(self.reasons[ref_id])
+        return reasons
+
+    def rules_paths(self, rules):
+        """The tree of paths in the user data read by the rules, see rule_paths."""
+        return merge_paths(self._rules_paths(rules))
+
+    def tip_refs(self, tip):
+        """All compound rules the rules of a tip refer to."""
+        refs = set()
+        for ref_id in rule_refs(tip.get("rules", [])):
+            if ref_id not in self.refs:
+                raise RuleGraphError(f"Tip {tip['id']} refers to unknown rule {ref_id}")
+            refs.add(ref_id)
+            refs.update(self.refs[ref_id])
+        return refs
+
+    def tips_paths(self, tips):
+        """The tree of paths in the user data read by the rules of the tips."""
+        paths = set()
+        for tip in tips:
+            paths.update(self._rules_paths(tip.get("rules", [])))
+        return merge_paths(paths)
+
+    def tips_depending_on(self, ref_id):
+        """Ids of the tips which use the compound rule, directly or through other rules."""
+        return list(self.dependent_tips[ref_id])
@@ -0,0 +1,84 @@
+"""
+Finds the paths in the user data the rules read, so the user data can be pruned to those paths
+before the rules are executed.
+
+Paths are stored as a tree of dicts: key -> the paths below that key, or None when the whole
+value at that key is read. A tree of None means the rules read the whole document.
+"""
+
+
+def _root_path(node):
+    """The path of a chain of names from the root ($.a.b), None for any other node."""
+    if type(node) is not tuple or not node:
+        return None
+    if node[0] == "(root)":
+        return ()
+    if node[0] == "." and type(node[2]) is tuple and node[2][0] == "name":
+        path = _root_path(node[1])
+        if path is not None:
+            return path + (node[2][1],)
+    return None
+
+
+def _find_paths(node, paths):
+    if type(node) is list:
+        for item in node:
+            _find_paths(item, paths)
+        return
+    if type(node) is not tuple or not node:
+        return
+
+    path = _root_path(node)
+    if path is not None:
+        paths.append(path)
+        return
+
+    for item in node[1:]:
+        _find_paths(item, paths)
+
+
+def rule_paths(ast):
+    """The paths from the root of the data the rule reads, the whole value at a path is read."""
+    paths = []
+    _find_paths(ast, paths)
+    return paths
+
+
+def merge_paths(paths):
+    """Merge paths into a tree of paths, a shorter path includes everything below it."""
+    tree = {}
+    for path in sorted(set(paths), key=len):
+        if not path:
+            return None
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if node is None:
+                break
+        else:
+            node[path[-1]] = None
+    return tree
+
+
+def referenced_paths(compiled_rules):
+    """The tree of paths read by a map of rule string -> AST."""
+    paths = []
+    for ast in compiled_rules.values():
+        paths.extend(rule_paths(ast))
+    return merge_paths(paths)
+
+
+def prune(data, paths):
+    """
+    Copy of the data with only the values at the paths. Lists are pruned item by item, like
+    objectpath reads a name from every dict in a list. Other values are kept as they are.
+    """
+    if paths is None:
+        return data
+    if type(data) is dict:
+        return {
+            key: prune(value, paths[key]) for key, value in data.items() if key in paths
+        }
+    if type(data) is list:
+        return [prune(item, paths) for item in data]
+    return data
@@ -0,0 +1,42 @@
+"""
+Freeze the objects uWSGI preloads in the master, so the garbage collector of the forked workers
+does not write to them.
+
+A collection writes to the header of every object it visits, which copies the memory page of
+the object into the worker. With TIPS_GC_FREEZE=1 the collector is disabled while the app loads
+in the master, the loaded objects are moved to the permanent generation with gc.freeze() before
+the fork and every worker enables the collector again. Outside of a preloading uWSGI master,
+the tests included, nothing changes.
+"""
+
+import gc
+
+from tips.config import get_gc_freeze
+
+
+def preloading():
+    """True in the uWSGI master which loads the app before it forks the workers."""
+    try:
+        import uwsgi
+    except ImportError:
+        return False
+    # with lazy-apps every worker loads the app after the fork
+    lazy = uwsgi.opt.get("lazy-apps") or uwsgi.opt.get("lazy")
+    return get_gc_freeze() and not lazy and uwsgi.worker_id() == 0
+
+
+def start_preload():
+    """Called before the app is loaded, collections would leave holes in the loaded memory."""
+    if preloading():
+        gc.disable()
+
+
+def finish_preload():
+    """Called once the app is loaded, the workers are forked after it."""
+    if preloading():
+        from uwsgidecorators import postfork
+
+        # only the garbage of the loading is collected, the rest is frozen
+        gc.collect()
+        gc.freeze()
+        postfork(gc.enable)
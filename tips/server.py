@@ -4,14 +4,30 @@ import os
 import json
 
 from tips.config import PROJECT_PATH
-from flask import request, send_from_directory
+from flask import Response, request, send_from_directory
 from sentry_sdk.integrations.flask import FlaskIntegration
-
-from tips.api.tip_generator import tips_generator
-from tips.config import get_sentry_dsn, get_photo_path
+from werkzeug.exceptions import BadRequest
+
+from tips.api import tip_generator
+from tips.api.tip_generator import (
+    get_tips_request_data,
+    tips_batch_generator,
+    tips_generator,
+)
+from tips.api.json_encoder import encode_tips, encode_tips_batch
+from tips.preload import finish_preload
+from tips.config import (
+    get_photo_path,
+    get_reload_interval,
+    get_rule_reorder_interval,
+    get_rule_stats_sample_rate,
+    get_sentry_dsn,
+)
 
 app = connexion.FlaskApp(__name__, specification_dir="api/")
 
+TIPS_VERSION_HEADER = "X-Tips-Version"
+
 if get_sentry_dsn():  # pragma: no cover
     sentry_sdk.init(
         dsn=get_sentry_dsn(),
@@ -21,35 +37,78 @@ if get_sentry_dsn():  # pragma: no cover
     )
 
 
-def get_tips_request_data(request_data):
-    user_data = {}
-    source_tips = []
-    optin = False
+def start_background_threads():
+    """
+    Reload changed tips content and reorder the rules on their measurements in the background.
+    Under uWSGI threads do not survive the fork of the workers, so every worker starts its own
+    threads after the fork.
+    """
+    reload_interval = get_reload_interval()
+    reorder_interval = get_rule_reorder_interval()
+    sample_rate = get_rule_stats_sample_rate()
+
+    def start():
+        if reload_interval > 0:
+            tip_generator.start_content_watcher(reload_interval)
+        if reorder_interval > 0 and sample_rate > 0:
+            tip_generator.start_rule_reorderer(reorder_interval, sample_rate)
+
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:
+        start()
+    else:  # pragma: no cover
+        postfork(start)
+
 
-    if "userData" in request_data:
-        user_data = request_data["userData"]
+start_background_threads()
 
-    if "tips" in request_data:
-        source_tips = request_data["tips"]
 
-    if "optin" in request_data and type(request_data["optin"]) is bool:
-        optin = request_data["optin"]
+def get_audience():
+    audience = request.args.get("audience", None)
+    if audience:
+        audience = audience.split(",")
+    return audience
+
 
-    return {"optin": optin, "user_data": user_data, "source_tips": source_tips}
+def tips_response(body, rule_set):
+    """Json response with the version of the rule set which generated the tips."""
+    response = Response(body, mimetype="application/json")
+    response.headers[TIPS_VERSION_HEADER] = rule_set.version
+    return response
 
 
 # Route is defined in openapi.yaml
 def get_tips():
     # This is a POST because the user data gets sent in the body.
     # This data is too large and inappropriate for a GET, also because of privacy reasons
-    audience = request.args.get("audience", None)
-    if audience:
-        audience = audience.split(",")
+    audience = get_audience()
+    limit = request.args.get("limit", None, type=int)
+    offset = request.args.get("offset", 0, type=int)
+
+    # the whole request uses the rule set it starts with
+    rule_set = tip_generator.rule_set
+    paths = rule_set.user_data_paths
+    request_data = get_tips_request_data(request_data=request.get_json(), paths=paths)
+    tips_data = tips_generator(
+        request_data, audience=audience, limit=limit, offset=offset, snapshot=rule_set
+    )
 
-    request_data = get_tips_request_data(request_data=request.get_json())
-    tips_data = tips_generator(request_data, audience=audience)
+    return tips_response(encode_tips(tips_data), rule_set)
 
-    return tips_data
+
+# Route is defined in openapi.yaml
+def get_tips_batch():
+    # Tips for many users in one call, the body is a list of bodies as sent to get_tips
+    rule_set = tip_generator.rule_set
+    requests_data = [
+        get_tips_request_data(request_data=request_data, paths=rule_set.user_data_paths)
+        for request_data in request.get_json()
+    ]
+    results = tips_batch_generator(
+        requests_data, audience=get_audience(), snapshot=rule_set
+    )
+    return tips_response(encode_tips_batch(results), rule_set)
 
 
 @app.route("/tips/static/tip_images/<path:filename>")
@@ -64,6 +123,9 @@ def health_check():
 
 app.add_api("openapi.yaml")
 
+
+finish_preload()
+
 # set the WSGI application callable to allow using uWSGI:
 application = app.app
 if __name__ == "__main__":  # pragma: no cover